@@ -0,0 +1,117 @@
+import os
+
+__all__ = ['BACKENDS', 'load_model', 'model_key', 'estimate_bytes']
+
+BACKENDS = ["whisper", "faster-whisper"]
+
+# Parameter counts in millions, for budgeting resident models without loading them
+MODEL_PARAMS = {"tiny": 39, "base": 74, "small": 244, "medium": 769, "large": 1550}
+
+
+def model_key(backend, model_name):
+    """Model identity used in transcription cache keys; plain names stay
+    whisper's so existing cache entries remain valid"""
+    return model_name if backend == "whisper" else f"{backend}/{model_name}"
+
+
+def load_model(backend, model_name):
+    """Load model_name with the given backend. Every backend's model has
+    transcribe(audio, on_segment=None, on_line=None, **options) taking a path or
+    16 kHz float32 samples, calling on_segment(segment) as each segment is
+    decoded and on_line(text) with any other console output, and returning
+    whisper's result dict (text, segments, language)."""
+    if backend == "whisper":
+        return WhisperModel(model_name)
+    if backend == "faster-whisper":
+        return FasterWhisperModel(model_name)
+    raise ValueError(f"Unknown transcription backend: {backend}")
+
+
+def estimate_bytes(backend, model_name):
+    """Approximate resident size of a loaded model"""
+    params = MODEL_PARAMS.get(model_name.split('.')[0].split('-')[0], MODEL_PARAMS["large"]) * 1_000_000
+    if backend == "faster-whisper":
+        from config import FASTER_WHISPER_COMPUTE_TYPE
+        if FASTER_WHISPER_COMPUTE_TYPE.startswith("int8"):
+            return params
+        if "16" in FASTER_WHISPER_COMPUTE_TYPE:
+            return params * 2
+    return params * 4
+
+
+class WhisperModel:
+    """Reference PyTorch implementation from openai-whisper"""
+    def __init__(self, model_name):
+        import whisper
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, on_segment=None, on_line=None, **options):
+        if on_segment is None:
+            return self.model.transcribe(audio, **options)
+        from progress import capture_segments
+        with capture_segments(on_segment, on_line):
+            return self.model.transcribe(audio, **dict(options, verbose=True))
+
+
+class FasterWhisperModel:
+    """CTranslate2 engine via faster-whisper, int8-quantised on CPU by default"""
+    # Whisper options faster-whisper understands under the same name
+    OPTIONS = {
+        'language', 'task', 'temperature', 'beam_size', 'best_of', 'patience',
+        'compression_ratio_threshold', 'log_prob_threshold', 'no_speech_threshold',
+        'condition_on_previous_text', 'initial_prompt', 'word_timestamps',
+        'prepend_punctuations', 'append_punctuations', 'suppress_tokens',
+    }
+
+    def __init__(self, model_name):
+        from faster_whisper import WhisperModel
+        from config import FASTER_WHISPER_DEVICE, FASTER_WHISPER_COMPUTE_TYPE, FASTER_WHISPER_THREADS
+
+        self.model = WhisperModel(
+            model_name,
+            device=FASTER_WHISPER_DEVICE,
+            compute_type=FASTER_WHISPER_COMPUTE_TYPE,
+            cpu_threads=FASTER_WHISPER_THREADS or min(os.cpu_count() or 4, 8),
+        )
+
+    def transcribe(self, audio, on_segment=None, on_line=None, verbose=None, **options):
+        if 'logprob_threshold' in options:
+            options['log_prob_threshold'] = options.pop('logprob_threshold')
+        options = {k: v for k, v in options.items() if k in self.OPTIONS}
+        # whisper's transcribe() decodes greedily unless asked otherwise; match it
+        options.setdefault('beam_size', 1)
+        if not isinstance(audio, str):
+            audio = audio.astype('float32', copy=False)
+
+        pieces, info = self.model.transcribe(audio, **options)
+        segments = []
+        for piece in pieces:
+            segment = {
+                'id': len(segments),
+                'seek': piece.seek,
+                'start': piece.start,
+                'end': piece.end,
+                'text': piece.text,
+                'tokens': list(piece.tokens),
+                'temperature': piece.temperature,
+                'avg_logprob': piece.avg_logprob,
+                'compression_ratio': piece.compression_ratio,
+                'no_speech_prob': piece.no_speech_prob,
+            }
+            if piece.words:
+                segment['words'] = [
+                    {'word': w.word, 'start': w.start, 'end': w.end, 'probability': w.probability}
+                    for w in piece.words
+                ]
+            segments.append(segment)
+            if on_segment:
+                on_segment(segment)
+            elif verbose:
+                from progress import format_segment_line
+                print(format_segment_line(segment), flush=True)
+
+        return {
+            'text': ''.join(segment['text'] for segment in segments),
+            'segments': segments,
+            'language': info.language,
+        }
@@ -0,0 +1,308 @@
+"""Performance measurements: backend speed and memory, app startup time,
+transcript writer micro-benchmarks and Gemini client behaviour under load.
+
+For run_benchmark the corpus is decoded once up front, so the numbers cover
+model loading and inference only. Every backend/model pair runs in a fresh
+process: peak RSS is a process-wide high-water mark and would otherwise carry
+over between runs."""
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from long_media import SAMPLE_RATE, decode_audio
+from metrics import peak_rss_mb, percentile
+
+__all__ = ['run_benchmark', 'measure_startup', 'measure_writers', 'measure_notes_client']
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def _run_one(backend, model_name, corpus, options, results):
+    from backends import load_model
+
+    try:
+        started = time.perf_counter()
+        model = load_model(backend, model_name)
+        load_seconds = time.perf_counter() - started
+        audio_seconds = 0.0
+        transcribe_seconds = 0.0
+        words = 0
+        for path in corpus:
+            audio = np.load(path, mmap_mode='r')
+            started = time.perf_counter()
+            result = model.transcribe(audio, **options)
+            transcribe_seconds += time.perf_counter() - started
+            audio_seconds += len(audio) / SAMPLE_RATE
+            words += len(result['text'].split())
+        results.put({
+            'backend': backend,
+            'model': model_name,
+            'files': len(corpus),
+            'audio_seconds': round(audio_seconds, 1),
+            'load_seconds': round(load_seconds, 2),
+            'transcribe_seconds': round(transcribe_seconds, 2),
+            'rtf': round(transcribe_seconds / audio_seconds, 4) if audio_seconds else None,
+            'words': words,
+            'peak_rss_mb': peak_rss_mb(),
+        })
+    except Exception as e:
+        results.put({'backend': backend, 'model': model_name, 'error': str(e), 'peak_rss_mb': peak_rss_mb()})
+
+
+def run_benchmark(files, backends, models, language=None):
+    """Yield one result dict per backend/model pair. rtf is transcription time
+    divided by audio duration, so lower is faster and below 1 is faster than real time."""
+    options = {'verbose': None}
+    if language:
+        options['language'] = language
+    ctx = multiprocessing.get_context("spawn")
+    corpus_dir = tempfile.mkdtemp(prefix="noter-benchmark-")
+    try:
+        corpus = []
+        for i, file_path in enumerate(files):
+            path = os.path.join(corpus_dir, f"{i:04d}.npy")
+            np.save(path, decode_audio(file_path))
+            corpus.append(path)
+
+        for backend in backends:
+            for model_name in models:
+                results = ctx.Queue()
+                process = ctx.Process(target=_run_one, args=(backend, model_name, corpus, options, results))
+                process.start()
+                # Read before joining so the child can flush its result and exit,
+                # but give up if it dies first (e.g. killed for running out of memory)
+                row = None
+                while row is None and (process.is_alive() or not results.empty()):
+                    try:
+                        row = results.get(timeout=1)
+                    except queue.Empty:
+                        continue
+                process.join()
+                if row is None or process.exitcode:
+                    row = row or {'backend': backend, 'model': model_name,
+                                  'error': f"benchmark process exited with code {process.exitcode}"}
+                yield row
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+
+def _import_times(module):
+    """Run `python -X importtime -c "import module"` and return
+    (total_us, {top-level package: self_us}), or raise with the child's error"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    total = None
+    packages = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == module and len(indent) == 1:
+            total = int(cumulative_us)
+    if proc.returncode or total is None:
+        lines = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(lines[-1] if lines else f"import {module} failed")
+    return total, packages
+
+
+def measure_startup(modules, runs=5, top=10):
+    """Yield the import time of each module, median of several fresh
+    interpreters, with the slowest top-level packages it pulls in.
+
+    A warm-up import runs first so .pyc compilation isn't counted. Packages
+    are ranked by their own (self) time, so a slow dependency shows up under
+    its name however deeply it is imported."""
+    for module in modules:
+        try:
+            _import_times(module)
+            samples = [_import_times(module) for _ in range(max(1, runs))]
+        except RuntimeError as e:
+            yield {'module': module, 'error': str(e)}
+            continue
+        totals = [total for total, _ in samples]
+        packages = {}
+        for _, times in samples:
+            for package, self_us in times.items():
+                packages.setdefault(package, []).append(self_us)
+        slowest = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)[:top]
+        yield {
+            'module': module,
+            'runs': len(samples),
+            'import_ms': round(statistics.median(totals) / 1000, 1),
+            'min_ms': round(min(totals) / 1000, 1),
+            'packages': [{'package': k, 'self_ms': round(v / 1000, 1)} for v, k in slowest],
+        }
+
+
+def _legacy_format_timestamp(seconds):
+    # utils.format_timestamp before it switched to integer arithmetic
+    from datetime import timedelta
+    td = timedelta(seconds=seconds)
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    secs = total_seconds % 60
+    milliseconds = int((td.total_seconds() - total_seconds) * 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02},{milliseconds:03}"
+
+
+def _legacy_write(result, fmt, path):
+    # TranscriptionManager.generate_* as they were: one pass per format over the full result
+    import json
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == "srt":
+            for i, segment in enumerate(result['segments'], start=1):
+                start = _legacy_format_timestamp(segment['start'])
+                end = _legacy_format_timestamp(segment['end'])
+                f.write(f"{i}\n{start} --> {end}\n{segment['text'].strip()}\n\n")
+        elif fmt == "vtt":
+            f.write("WEBVTT\n\n")
+            for segment in result['segments']:
+                start = _legacy_format_timestamp(segment['start']).replace(',', '.')
+                end = _legacy_format_timestamp(segment['end']).replace(',', '.')
+                f.write(f"{start} --> {end}\n")
+                f.write(f"{segment['text'].strip()}\n\n")
+        elif fmt == "txt":
+            f.write(result["text"])
+        else:
+            json.dump({'text': result['text'], 'segments': result['segments'], 'language': result['language']},
+                      f, indent=2, ensure_ascii=False)
+
+
+def _synthetic_result(count):
+    """A whisper-shaped result with count ~4 second segments, tokens and all"""
+    segments = []
+    for i in range(count):
+        text = f" This is sentence number {i} of the synthetic benchmark transcript."
+        segments.append({
+            'id': i, 'seek': i * 400, 'start': i * 4.0 + 0.02 * (i % 7), 'end': i * 4.0 + 3.5,
+            'text': text, 'tokens': list(range(50000, 50016)), 'temperature': 0.0,
+            'avg_logprob': -0.21, 'compression_ratio': 1.4, 'no_speech_prob': 0.01,
+        })
+    return {'text': ''.join(s['text'] for s in segments), 'segments': segments, 'language': 'en'}
+
+
+def _best_of(repeat, func, *args):
+    best = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+
+def measure_writers(segments=20000, repeat=5, formats=("srt", "vtt", "txt", "json")):
+    """Yield micro-benchmark rows comparing the old per-format writers and
+    timedelta formatter with SegmentStore + write_transcripts. Times are the
+    best of `repeat` runs, in milliseconds."""
+    import tracemalloc
+
+    from segments import SegmentStore
+    from transcript_writer import write_transcripts
+    from utils import format_timestamp
+
+    result = _synthetic_result(segments)
+    stamps = [s['start'] for s in result['segments']] + [s['end'] for s in result['segments']]
+    yield {
+        'benchmark': 'format_timestamp', 'calls': len(stamps),
+        'legacy_ms': _best_of(repeat, lambda: [_legacy_format_timestamp(t) for t in stamps]),
+        'new_ms': _best_of(repeat, lambda: [format_timestamp(t) for t in stamps]),
+    }
+
+    tracemalloc.start()
+    store = SegmentStore.from_result(result)
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    yield {
+        'benchmark': 'segment_store', 'segments': segments,
+        'build_ms': _best_of(repeat, SegmentStore.from_result, result),
+        'store_bytes': store_bytes,
+    }
+
+    out_dir = tempfile.mkdtemp(prefix="noter-writers-")
+    try:
+        for fmt in formats:
+            path = os.path.join(out_dir, f"out.{fmt}")
+            fmt_store = SegmentStore.from_result(result, keep_extras=fmt == "json")
+            yield {
+                'benchmark': f'write_{fmt}', 'segments': segments,
+                'legacy_ms': _best_of(repeat, _legacy_write, result, fmt, path),
+                'new_ms': _best_of(repeat, write_transcripts, fmt_store, {fmt: path}),
+                'bytes': os.path.getsize(path),
+            }
+        outputs = {fmt: os.path.join(out_dir, f"all.{fmt}") for fmt in formats}
+        yield {
+            'benchmark': 'write_all', 'segments': segments, 'formats': list(formats),
+            'legacy_ms': _best_of(repeat, lambda: [_legacy_write(result, f, p) for f, p in outputs.items()]),
+            'new_ms': _best_of(repeat, write_transcripts, SegmentStore.from_result(result, keep_extras=True), outputs),
+        }
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def measure_notes_client(requests=40, callers=8, concurrency=4, requests_per_minute=0, tokens_per_minute=0,
+                         latency=0.2, jitter=0.1, failure_rate=0.1, quota_per_minute=0, prompt_tokens=2000,
+                         max_retries=5, backoff=0.2, seed=1):
+    """Yield one row calling a FakeModel directly, as NotesManager used to,
+    and one going through GeminiClient, for the same load: `requests` prompts
+    sent from `callers` threads against a service that fails failure_rate of
+    requests and rejects more than quota_per_minute. Needs no network."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from fake_gemini import FakeModel
+    from gemini_client import GeminiClient
+
+    prompt = "Content:\n" + "word " * (prompt_tokens * 4 // 5)
+
+    def run(name, send, stats=None):
+        latencies, errors = [], []
+
+        def one(_):
+            started = time.perf_counter()
+            try:
+                send(prompt)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(type(e).__name__)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            list(executor.map(one, range(requests)))
+        wall = time.perf_counter() - started
+        row = {
+            'client': name, 'requests': requests, 'ok': len(latencies), 'failed': len(errors),
+            'wall_seconds': round(wall, 3),
+            'ok_per_minute': round(len(latencies) * 60 / wall, 1) if wall > 0 else None,
+            'p50_seconds': percentile(latencies, 0.5), 'p95_seconds': percentile(latencies, 0.95),
+        }
+        row.update(stats() if stats else {})
+        return row
+
+    def fake():
+        return FakeModel(latency, jitter, quota_per_minute, failure_rate, seed=seed)
+
+    direct = fake()
+    yield run('direct', lambda p: direct.generate_content(p).text)
+
+    model = fake()
+    client = GeminiClient(lambda: model, requests_per_minute, tokens_per_minute, concurrency,
+                          timeout=max(1.0, (latency + jitter) * 4), max_retries=max_retries,
+                          backoff=backoff, backoff_max=backoff * 32)
+    yield run('client', client.generate, client.stats)
@@ -0,0 +1,66 @@
+import re
+
+from utils import format_timestamp
+
+__all__ = ['estimate_tokens', 'segments_from_text', 'split_into_windows', 'window_label']
+
+# Rough characters-per-token ratio for English prose; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def segments_from_text(text):
+    """Sentence-level pseudo segments for transcripts that carry no Whisper segments"""
+    sentences = [s for s in re.split(r'(?<=[.!?])\s+', text.strip()) if s]
+    return [{'start': None, 'end': None, 'text': sentence} for sentence in sentences]
+
+
+def split_into_windows(segments, max_tokens, overlap_tokens=0):
+    """Group segments into windows of at most max_tokens, never splitting a segment.
+
+    Each window after the first repeats trailing segments of the previous one,
+    up to overlap_tokens, so ideas that straddle a boundary keep their context.
+    Returns dicts with 'start', 'end' (seconds or None) and 'text'."""
+    sizes = [estimate_tokens(segment['text']) for segment in segments]
+    windows = []
+    first = 0
+    while first < len(segments):
+        last = first
+        budget = sizes[first]
+        while last + 1 < len(segments) and budget + sizes[last + 1] <= max_tokens:
+            last += 1
+            budget += sizes[last]
+        windows.append(_window(segments[first:last + 1]))
+        if last + 1 >= len(segments):
+            break
+
+        # Step back from the end of this window to build the overlap for the next
+        next_first = last + 1
+        overlap = 0
+        while next_first - 1 > first and overlap + sizes[next_first - 1] <= overlap_tokens:
+            next_first -= 1
+            overlap += sizes[next_first]
+        first = next_first
+    return windows
+
+
+def _window(segments):
+    start = segments[0].get('start')
+    end = segments[-1].get('end')
+    return {
+        'start': start,
+        'end': end,
+        'text': ' '.join(segment['text'].strip() for segment in segments),
+    }
+
+
+def window_label(window, index, total):
+    label = f"Part {index} of {total}"
+    if window['start'] is not None and window['end'] is not None:
+        start = format_timestamp(window['start']).split(',')[0]
+        end = format_timestamp(window['end']).split(',')[0]
+        label += f" ({start} - {end})"
+    return label
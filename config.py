@@ -9,17 +9,95 @@ BASE_DIR = Path(__file__).resolve().parent
 env_path = BASE_DIR / '.env'
 load_dotenv(env_path)
 
-# Get environment variables with error handling
+# Checked when notes are first needed, so transcription works without a key
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
 
 # Get notes directory with default fallback
 NOTES_OUTPUT_DIR = os.getenv('NOTES_OUTPUT_DIR', str(BASE_DIR / 'notes'))
 
-# Convert to proper path and create if doesn't exist
+# Created when the first notes file is written
 NOTES_OUTPUT_DIR = Path(NOTES_OUTPUT_DIR)
-NOTES_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-print(f"Config loaded - API Key present: {bool(GEMINI_API_KEY)}")
-print(f"Notes directory: {NOTES_OUTPUT_DIR}")
+# Number of transcription worker processes (1 = transcribe in the app process)
+TRANSCRIBE_WORKERS = max(1, int(os.getenv('TRANSCRIBE_WORKERS', '1')))
+
+# Transcription engine: "whisper" (PyTorch) or "faster-whisper" (CTranslate2, needs the
+# faster-whisper package). FASTER_WHISPER_THREADS=0 picks a sensible CPU thread count
+TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'whisper')
+FASTER_WHISPER_DEVICE = os.getenv('FASTER_WHISPER_DEVICE', 'cpu')
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv('FASTER_WHISPER_COMPUTE_TYPE', 'int8')
+FASTER_WHISPER_THREADS = max(0, int(os.getenv('FASTER_WHISPER_THREADS', '0')))
+
+# Models kept loaded per process so switching back is instant: at most MODEL_POOL_SIZE,
+# within MODEL_POOL_MAX_MB of estimated weights (0 = count limit only)
+MODEL_POOL_SIZE = max(1, int(os.getenv('MODEL_POOL_SIZE', '2')))
+MODEL_POOL_MAX_MB = max(0, int(os.getenv('MODEL_POOL_MAX_MB', '4096')))
+
+# Every queued file is recorded with its stage in this SQLite database, so an interrupted
+# batch resumes where it stopped and files already done aren't queued again ("" disables)
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', str(NOTES_OUTPUT_DIR / 'jobs.sqlite3'))
+
+# Notes and transcripts are indexed for full-text search (SQLite FTS5) as they are written,
+# transcripts segment by segment with their timestamps ("" disables)
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', str(NOTES_OUTPUT_DIR / 'search.sqlite3'))
+
+# Per-file stage timings, throughput, queue depths, LLM tokens and memory are appended to
+# METRICS_PATH as JSON lines, and running totals kept in METRICS_PROMETHEUS_PATH for
+# node_exporter's textfile collector ("" disables either)
+METRICS_PATH = os.getenv('METRICS_PATH', '')
+METRICS_PROMETHEUS_PATH = os.getenv('METRICS_PROMETHEUS_PATH', '')
+
+# Transcription output reaches the UI in batches, at most one update per interval
+UI_UPDATE_INTERVAL_MS = max(10, int(os.getenv('UI_UPDATE_INTERVAL_MS', '100')))
+
+# With several workers, files at least LONG_MEDIA_SECONDS long are split at silences into
+# ~LONG_MEDIA_CHUNK_SECONDS chunks transcribed in parallel (0 disables splitting)
+LONG_MEDIA_SECONDS = max(0, int(os.getenv('LONG_MEDIA_SECONDS', '1200')))
+LONG_MEDIA_CHUNK_SECONDS = max(30, int(os.getenv('LONG_MEDIA_CHUNK_SECONDS', '300')))
+
+# Notes are generated alongside transcription: how many Gemini requests may run
+# at once, and how many finished transcripts may wait before transcription pauses
+NOTES_CONCURRENCY = max(1, int(os.getenv('NOTES_CONCURRENCY', '2')))
+NOTES_QUEUE_SIZE = max(1, int(os.getenv('NOTES_QUEUE_SIZE', '4')))
+
+# Whisper results are cached by media hash + model + options; 0 disables the cache
+TRANSCRIPT_CACHE_DIR = Path(os.getenv('TRANSCRIPT_CACHE_DIR', str(NOTES_OUTPUT_DIR / '.cache' / 'transcripts')))
+TRANSCRIPT_CACHE_MAX_MB = max(0, int(os.getenv('TRANSCRIPT_CACHE_MAX_MB', '512')))
+
+# Decoded 16 kHz PCM is cached as .npy (memory-mapped when transcribing); 0 disables.
+# PREFETCH_WORKERS threads decode upcoming files while the current one transcribes
+PCM_CACHE_DIR = Path(os.getenv('PCM_CACHE_DIR', str(NOTES_OUTPUT_DIR / '.cache' / 'pcm')))
+PCM_CACHE_MAX_MB = max(0, int(os.getenv('PCM_CACHE_MAX_MB', '4096')))
+PREFETCH_WORKERS = max(1, int(os.getenv('PREFETCH_WORKERS', '2')))
+
+# Gemini responses are cached by model, generation config, prompt version and transcript hash
+NOTES_CACHE_DIR = Path(os.getenv('NOTES_CACHE_DIR', str(NOTES_OUTPUT_DIR / '.cache' / 'notes')))
+NOTES_CACHE_MAX_MB = max(0, int(os.getenv('NOTES_CACHE_MAX_MB', '64')))
+NOTES_CACHE_TTL_DAYS = max(0, int(os.getenv('NOTES_CACHE_TTL_DAYS', '30')))
+
+# Transcripts longer than NOTES_CHUNK_TOKENS (estimated) get map-reduce notes: partial
+# notes for overlapping windows generated concurrently, then merged. 0 disables chunking
+NOTES_CHUNK_TOKENS = max(0, int(os.getenv('NOTES_CHUNK_TOKENS', '12000')))
+NOTES_CHUNK_OVERLAP_TOKENS = max(0, int(os.getenv('NOTES_CHUNK_OVERLAP_TOKENS', '400')))
+NOTES_CHUNK_CONCURRENCY = max(1, int(os.getenv('NOTES_CHUNK_CONCURRENCY', '4')))
+
+# Request title and notes together as one JSON response (falls back to two requests)
+NOTES_SINGLE_CALL = os.getenv('NOTES_SINGLE_CALL', '1').lower() not in ('0', 'false', 'no')
+
+# Stream notes into the .md file and the progress terminal as they are generated
+NOTES_STREAM = os.getenv('NOTES_STREAM', '0').lower() not in ('0', 'false', 'no')
+
+# Every Gemini request keeps to GEMINI_REQUESTS_PER_MINUTE and GEMINI_TOKENS_PER_MINUTE
+# (0 = unlimited), with at most GEMINI_CONCURRENCY in flight. Requests time out after
+# GEMINI_TIMEOUT_SECONDS; quota, timeout and server errors are retried up to
+# GEMINI_MAX_RETRIES times, backing off exponentially from GEMINI_BACKOFF_SECONDS with jitter
+GEMINI_REQUESTS_PER_MINUTE = max(0, int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '10')))
+GEMINI_TOKENS_PER_MINUTE = max(0, int(os.getenv('GEMINI_TOKENS_PER_MINUTE', '1000000')))
+GEMINI_CONCURRENCY = max(1, int(os.getenv('GEMINI_CONCURRENCY', '4')))
+GEMINI_TIMEOUT_SECONDS = max(1.0, float(os.getenv('GEMINI_TIMEOUT_SECONDS', '120')))
+GEMINI_MAX_RETRIES = max(0, int(os.getenv('GEMINI_MAX_RETRIES', '5')))
+GEMINI_BACKOFF_SECONDS = max(0.0, float(os.getenv('GEMINI_BACKOFF_SECONDS', '2')))
+GEMINI_BACKOFF_MAX_SECONDS = max(0.0, float(os.getenv('GEMINI_BACKOFF_MAX_SECONDS', '60')))
+
+# Answer notes requests offline from fake_gemini.FakeModel instead of the API (no key needed)
+GEMINI_FAKE = os.getenv('GEMINI_FAKE', '0').lower() not in ('0', 'false', 'no')
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+__all__ = ['cache_key', 'DiskCache']
+
+
+def cache_key(**parts):
+    """Stable hex key for a set of JSON-serialisable parts"""
+    material = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class DiskCache:
+    """Directory of gzipped JSON entries with LRU eviction and an optional TTL.
+
+    Entry mtimes double as LRU timestamps: hits touch the file, and puts evict
+    the least recently used entries once the directory grows past max_bytes.
+    Entries older than ttl_seconds (by creation time) are treated as misses."""
+    SUFFIX = '.json.gz'
+
+    def __init__(self, cache_dir, max_bytes, ttl_seconds=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key):
+        return self.cache_dir / f"{key}{self.SUFFIX}"
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.count(False)
+            return None
+        created = entry.get('meta', {}).get('created', 0)
+        if self.ttl_seconds is not None and time.time() - created > self.ttl_seconds:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            self.count(False)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.count(True)
+        return entry['value']
+
+    def put(self, key, value, **meta):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = {'meta': dict(meta, created=time.time()), 'value': value}
+        # Write to a temp file and rename so concurrent writers never expose a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+    def files(self):
+        if not self.cache_dir.is_dir():
+            return []
+        files = []
+        for path in self.cache_dir.glob(f'*{self.SUFFIX}'):
+            try:
+                files.append((path, path.stat()))
+            except OSError:
+                continue
+        return files
+
+    def size(self):
+        return sum(stat.st_size for _, stat in self.files())
+
+    def evict(self, max_bytes=None, keep=()):
+        """Remove least recently used entries until the cache fits in max_bytes,
+        never removing the paths in keep"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        files = sorted(self.files(), key=lambda item: item[1].st_mtime)
+        total = sum(stat.st_size for _, stat in files)
+        removed = 0
+        for path, stat in files:
+            if total <= max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= stat.st_size
+            removed += 1
+        return removed
+
+    def entries(self):
+        """Metadata for every entry, most recently used first"""
+        entries = []
+        for path, stat in sorted(self.files(), key=lambda item: item[1].st_mtime, reverse=True):
+            entries.append(dict(self.read_meta(path), key=path.name[:-len(self.SUFFIX)],
+                                bytes=stat.st_size, last_used=stat.st_mtime))
+        return entries
+
+    def read_meta(self, path):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f).get('meta', {})
+        except (OSError, ValueError):
+            return {}
+
+    def purge(self, older_than_days=None):
+        """Delete every entry, or only those not used in the last older_than_days"""
+        cutoff = time.time() - older_than_days * 86400 if older_than_days is not None else None
+        removed = 0
+        for path, stat in self.files():
+            if cutoff is not None and stat.st_mtime >= cutoff:
+                continue
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                continue
+        return removed
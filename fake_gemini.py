@@ -0,0 +1,79 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+
+__all__ = ['FakeApiError', 'FakeModel']
+
+
+class FakeApiError(Exception):
+    """Stand-in for google.api_core errors, carrying the HTTP status as .code"""
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Offline stand-in for genai.GenerativeModel, for exercising the client
+    and the notes pipeline without network access or quota.
+
+    Each request takes `latency` seconds (plus up to `jitter`) and answers
+    with canned notes built from the prompt. Like the real service it can
+    reject requests beyond requests_per_minute over a sliding minute (429),
+    fail a fraction of them (503) and give up on requests slower than the
+    timeout in request_options (504)."""
+    def __init__(self, latency=0.5, jitter=0.0, requests_per_minute=0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.calls = 0
+
+    def admit(self):
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= 60:
+                self.recent.popleft()
+            if self.requests_per_minute and len(self.recent) >= self.requests_per_minute:
+                raise FakeApiError(429, "Resource has been exhausted (e.g. check quota).")
+            self.recent.append(now)
+            if self.random.random() < self.failure_rate:
+                raise FakeApiError(503, "The service is currently unavailable.")
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        latency = self.admit()
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise FakeApiError(504, "Deadline Exceeded")
+        text = self.respond(prompt)
+        if not stream:
+            time.sleep(latency)
+            return FakeResponse(text)
+        return self.stream(text, latency)
+
+    def stream(self, text, latency, pieces=4):
+        step = max(1, len(text) // pieces)
+        for start in range(0, len(text), step):
+            time.sleep(latency / pieces)
+            yield FakeResponse(text[start:start + step])
+
+    def respond(self, prompt):
+        content = prompt.rsplit("Content:", 1)[-1].strip()
+        if prompt.startswith("Generate a short, descriptive title"):
+            return "Fake-Notes"
+        notes = f"## Summary\n\n{content[:200]}\n\n## Details\n\n- {len(content.split())} words of content"
+        if "Respond with a single JSON object" in prompt:
+            return json.dumps({"title": "Fake-Notes", "markdown": notes})
+        return notes
@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+
+from chunking import estimate_tokens
+
+__all__ = ['TokenBucket', 'RateLimiter', 'GeminiClient', 'is_retryable']
+
+# HTTP statuses worth retrying: timeouts, quota and transient server errors
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+# google.api_core exception names, for errors that carry no usable code
+RETRYABLE_NAMES = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+                   'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'RetryError'}
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # google.api_core exceptions carry the HTTP status as .code
+    return getattr(error, 'code', None) in RETRYABLE_CODES or type(error).__name__ in RETRYABLE_NAMES
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 units per second up to one minute's worth"""
+    def __init__(self, per_minute, now):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount is available (requests larger than the bucket wait for a full one)"""
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets; 0 disables either.
+    acquire() blocks until both have room and returns the seconds it waited."""
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        now = clock()
+        self.requests = TokenBucket(requests_per_minute, now) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, now) if tokens_per_minute > 0 else None
+
+    def acquire(self, tokens=1):
+        started = self.clock()
+        while True:
+            with self.lock:
+                now = self.clock()
+                wanted = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+                          if bucket is not None]
+                for bucket, _ in wanted:
+                    bucket.refill(now)
+                wait = max([bucket.wait_time(amount) for bucket, amount in wanted], default=0.0)
+                if wait <= 0:
+                    for bucket, amount in wanted:
+                        bucket.take(amount)
+                    return now - started
+            self.sleep(wait)
+
+
+class GeminiClient:
+    """generate_content() with the safeguards parallel notes generation needs.
+
+    Callers on any thread share one rate limiter and at most `concurrency`
+    requests in flight. Each request gets `timeout` seconds, and quota,
+    timeout and transient server errors are retried up to max_retries times
+    with exponential backoff and full jitter. model_factory() returns the
+    GenerativeModel (or a stand-in such as fake_gemini.FakeModel) on first use.
+
+    on_usage(prompt_tokens, response_tokens), where given, hears what each
+    successful request cost: the response's usage metadata, or an estimate
+    when it has none."""
+    def __init__(self, model_factory, requests_per_minute=0, tokens_per_minute=0, concurrency=4,
+                 timeout=120, max_retries=5, backoff=2.0, backoff_max=60.0, sleep=time.sleep):
+        self.model_factory = model_factory
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute, sleep=sleep)
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.counts = {'attempts': 0, 'retries': 0, 'failures': 0, 'throttled_seconds': 0.0,
+                       'backoff_seconds': 0.0, 'prompt_tokens': 0, 'response_tokens': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def stats(self):
+        with self.lock:
+            return {name: round(value, 3) if isinstance(value, float) else value
+                    for name, value in self.counts.items()}
+
+    def backoff_delay(self, attempt):
+        """Full jitter: uniform between 0 and the exponential ceiling for this attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def retry(self, error, attempt):
+        """Back off before retrying a failed attempt; False if it isn't worth another"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            self.count('failures')
+            return False
+        delay = self.backoff_delay(attempt)
+        self.count('retries')
+        self.count('backoff_seconds', delay)
+        self.sleep(delay)
+        return True
+
+    def usage(self, prompt, text, response, on_usage=None):
+        metadata = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(metadata, 'prompt_token_count', None)
+        response_tokens = getattr(metadata, 'candidates_token_count', None)
+        prompt_tokens = estimate_tokens(prompt) if prompt_tokens is None else prompt_tokens
+        response_tokens = estimate_tokens(text) if response_tokens is None else response_tokens
+        self.count('prompt_tokens', prompt_tokens)
+        self.count('response_tokens', response_tokens)
+        if on_usage:
+            on_usage(prompt_tokens, response_tokens)
+
+    def throttle(self, prompt):
+        self.count('throttled_seconds', self.limiter.acquire(estimate_tokens(prompt)))
+        self.count('attempts')
+
+    def generate(self, prompt, on_usage=None):
+        """The response text for prompt, under the rate limit and concurrency bound, retried"""
+        model = self.model_factory()
+        for attempt in range(self.max_retries + 1):
+            self.throttle(prompt)
+            try:
+                with self.slots:
+                    response = model.generate_content(prompt, request_options={'timeout': self.timeout})
+                    text = response.text
+            except Exception as e:
+                if not self.retry(e, attempt):
+                    raise
+                continue
+            self.usage(prompt, text, response, on_usage)
+            return text
+
+    def stream(self, prompt, on_usage=None):
+        """Yield the response text chunk by chunk. Failures before the first
+        chunk are retried like generate(); later ones propagate, since part of
+        the response has already been handed out."""
+        model = self.model_factory()
+        for attempt in range(self.max_retries + 1):
+            self.throttle(prompt)
+            texts = []
+            chunk = None
+            try:
+                with self.slots:
+                    for chunk in model.generate_content(prompt, stream=True, request_options={'timeout': self.timeout}):
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks without text parts (e.g. only safety metadata)
+                            continue
+                        if text:
+                            texts.append(text)
+                            yield text
+            except Exception as e:
+                if texts:
+                    self.count('failures')
+                    raise
+                if not self.retry(e, attempt):
+                    raise
+                continue
+            # The last chunk carries the usage metadata for the whole response
+            self.usage(prompt, "".join(texts), chunk, on_usage)
+            return
@@ -0,0 +1,225 @@
+import json
+import os
+import sys
+import threading
+import time
+from queue import Empty, Queue
+
+from pipeline import current_file, set_current_file
+
+__all__ = ['Setting', 'HeadlessUI', 'build_manager', 'run_batch', 'run_watch']
+
+
+class Setting:
+    """Minimal stand-in for a Tk variable: just get() and set()"""
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessUI:
+    """Implements the callbacks TranscriptionManager expects from TranscriberUI,
+    emitting every update as a JSON line instead of touching a window.
+
+    output_format may name several formats, as a list or comma-separated."""
+    def __init__(self, model_name="small", output_format="srt", output_dir="", stream=None):
+        self.model_var = Setting(model_name)
+        self.format_var = Setting(output_format)
+        self.output_dir_var = Setting(output_dir)
+        self.stream = stream or sys.__stdout__
+        self.lock = threading.Lock()
+        self.transcription_state = "ready"
+        self.notes_state = "ready"
+
+    def emit(self, event, **fields):
+        record = {"event": event, "time": round(time.time(), 3)}
+        # Tagged with the file of the emitting thread: notes for one file
+        # run while the next one transcribes
+        file_path = current_file()
+        if file_path:
+            record["file"] = file_path
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        # One write per line so records from the output thread never interleave
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def update_output(self, text):
+        for line in text.split("\n"):
+            self.emit("output", text=line)
+
+    def update_segments(self, file_path, segments):
+        for segment in segments:
+            self.emit("segment", file=file_path, start=round(segment['start'], 3),
+                      end=round(segment['end'], 3), text=segment['text'].strip())
+
+    def update_progress(self, file_path, percent, eta):
+        self.emit("progress", file=file_path, percent=percent, eta_seconds=eta)
+
+    def update_status(self, text):
+        self.emit("status", message=text)
+
+    def update_transcription_state(self, state):
+        self.transcription_state = state
+        self.emit("transcription_state", state=state)
+
+    def update_notes_state(self, state):
+        self.notes_state = state
+        self.emit("notes_state", state=state)
+
+
+def build_manager(ui, workers=1, notes=True, notes_concurrency=None, notes_queue_size=None, use_cache=True,
+                  notes_options=None, long_media_seconds=None, backend=None, jobs=True, metrics_path=None,
+                  prometheus_path=None):
+    """TranscriptionManager driving ui, with only the given overrides of the config defaults.
+    Each finished file's metrics are emitted as a file_metrics event."""
+    # Imported here so `noter --help` and friends never load whisper/torch
+    from transcription_manager import TranscriptionManager
+
+    output_dir = ui.output_dir_var.get()
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    pipeline_options = {}
+    if notes_concurrency:
+        pipeline_options['notes_concurrency'] = notes_concurrency
+    if notes_queue_size:
+        pipeline_options['notes_queue_size'] = notes_queue_size
+    if long_media_seconds is not None:
+        pipeline_options['long_media_seconds'] = long_media_seconds
+    if backend:
+        pipeline_options['backend'] = backend
+    if not jobs:
+        pipeline_options['job_store_path'] = ""
+    if metrics_path:
+        pipeline_options['metrics_path'] = metrics_path
+    if prometheus_path:
+        pipeline_options['prometheus_path'] = prometheus_path
+    manager = TranscriptionManager(ui, model_name=ui.model_var.get(), echo_stdout=False, workers=workers,
+                                   use_cache=use_cache, notes_options=notes_options, **pipeline_options)
+    if not notes:
+        manager.notes_manager = None
+    manager.metrics.on_record = lambda record: ui.emit("file_metrics", **record)
+    return manager
+
+
+def file_callbacks(ui):
+    """on_file_start and on_file_done emitting file events, and the list of
+    files that failed"""
+    started = {}
+    failed = []
+    lock = threading.Lock()
+
+    def on_file_start(file_path):
+        set_current_file(file_path)
+        started[file_path] = time.time()
+        ui.emit("file_started")
+
+    def on_file_done(file_path, ok):
+        # May run on a notes thread while the next file is already transcribing
+        with lock:
+            if not ok:
+                failed.append(file_path)
+            seconds = time.time() - started.pop(file_path, time.time())
+        ui.emit("file_finished", file=file_path, ok=ok, seconds=round(seconds, 3))
+
+    return on_file_start, on_file_done, failed
+
+
+def emit_stats(ui, manager):
+    set_current_file(None)
+    for stats in manager.get_stage_stats():
+        ui.emit("stage_stats", **stats)
+    if manager.metrics.finished:
+        ui.emit("metrics_summary", **manager.metrics.summary())
+    notes_cache = manager.notes_manager.cache_stats() if manager.notes_manager else None
+    if notes_cache:
+        ui.emit("cache_stats", cache="notes", **notes_cache)
+    if manager.notes_manager:
+        ui.emit("client_stats", client="gemini", **manager.notes_manager.client_stats())
+
+
+def shutdown(manager):
+    manager.shutdown_scheduler()
+    manager.write_stage.shutdown()
+    manager.notes_stage.shutdown()
+    manager.output_queue.put("STOP")
+    manager.output_thread.join(timeout=5)
+
+
+def run_batch(files, workers=1, model_name="small", output_format="srt", output_dir="", resume=False,
+              **options):
+    """Transcribe files headlessly, on a pool of worker processes when workers > 1.
+    options are build_manager's.
+
+    With the job store, files an identical earlier run already finished are
+    skipped, and resume also picks up every job an interrupted run left
+    unfinished. Returns the number of files that failed."""
+    ui = HeadlessUI(model_name, output_format, output_dir)
+    manager = build_manager(ui, workers=max(1, min(workers, len(files) or workers)), **options)
+
+    claimed = manager.claim_pending() if resume else []
+    claimed += manager.claim(files)
+    for file_path in sorted(set(map(os.path.abspath, files)).difference(claimed)):
+        ui.emit("file_skipped", file=file_path, reason="already done")
+
+    on_file_start, on_file_done, failed = file_callbacks(ui)
+    try:
+        manager.process_files(claimed, on_file_start=on_file_start, on_file_done=on_file_done)
+        emit_stats(ui, manager)
+    finally:
+        shutdown(manager)
+    return len(failed)
+
+
+def run_watch(directories, workers=1, model_name="small", output_format="srt", output_dir="", recursive=False,
+              settle_seconds=5.0, poll_interval=2.0, skip_existing=False, polling=False, stop=None, **options):
+    """Transcribe media landing in directories until interrupted (or stop, a
+    threading.Event, is set). options are build_manager's.
+
+    Files are taken once they have stopped changing for settle_seconds, and
+    only once per content. Files arriving while a batch is in progress make
+    up the next batch. Returns the number of files that failed."""
+    from watcher import FolderWatcher
+
+    ui = HeadlessUI(model_name, output_format, output_dir)
+    manager = build_manager(ui, workers=workers, **options)
+    ready = Queue()
+
+    def on_ready(file_path):
+        ui.emit("file_detected", file=file_path)
+        ready.put(file_path)
+
+    watcher = FolderWatcher(directories, on_ready, recursive=recursive, settle_seconds=settle_seconds,
+                            poll_interval=poll_interval, skip_existing=skip_existing, polling=polling)
+    on_file_start, on_file_done, failed = file_callbacks(ui)
+    stop = stop or threading.Event()
+    try:
+        watcher.start()
+        ui.emit("watch_started", directories=watcher.directories, mode=watcher.mode)
+        while not stop.is_set():
+            try:
+                batch = [ready.get(timeout=1)]
+            except Empty:
+                continue
+            while not ready.empty():
+                batch.append(ready.get())
+            files = manager.claim(batch)
+            for file_path in sorted(set(batch).difference(files)):
+                ui.emit("file_skipped", file=file_path, reason="already done")
+            if files:
+                manager.process_files(files, on_file_start=on_file_start, on_file_done=on_file_done)
+                set_current_file(None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        emit_stats(ui, manager)
+        shutdown(manager)
+        ui.emit("watch_stopped")
+    return len(failed)
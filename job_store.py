@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+__all__ = ['STAGES', 'JobStore']
+
+# queued -> transcribed (transcripts written) -> done (notes written), or failed.
+# Failed notes don't fail the job: it keeps its stage and error, so resuming
+# it only retries the notes
+STAGES = ["queued", "transcribed", "done", "failed"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    source TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    backend TEXT,
+    model TEXT,
+    formats TEXT,
+    output_dir TEXT,
+    stage TEXT NOT NULL,
+    outputs TEXT,
+    notes_path TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL,
+    updated REAL
+)
+"""
+
+
+class JobStore:
+    """Durable record of every file handed to the pipeline, in SQLite.
+
+    One row per source file holds the settings it was queued with, its stage
+    and the paths it produced. Each stage change is committed as it happens,
+    so after a crash or a closed window the unfinished jobs can be picked up
+    where they stopped. Safe to use from several threads."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            # WAL keeps each commit to one small append, and readers never block writers
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(SCHEMA)
+
+    def execute(self, sql, params=()):
+        with self.lock, self.db:
+            return self.db.execute(sql, params).rowcount
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return [self.to_job(row) for row in self.db.execute(sql, params)]
+
+    @staticmethod
+    def to_job(row):
+        job = dict(row)
+        job['formats'] = job['formats'].split(',') if job['formats'] else []
+        job['outputs'] = json.loads(job['outputs']) if job['outputs'] else {}
+        return job
+
+    def get(self, file_path):
+        jobs = self.query("SELECT * FROM jobs WHERE source = ?", (os.path.abspath(file_path),))
+        return jobs[0] if jobs else None
+
+    def add(self, file_path, backend, model, formats, output_dir=""):
+        """Record file_path as a job with these settings. Returns the stage
+        to start it from, "queued" or "transcribed" (only notes left), or
+        None when an identical job already finished and its files are still
+        there. A changed file or changed settings start it over."""
+        source = os.path.abspath(file_path)
+        stat = os.stat(source)
+        formats = list(formats)
+        job = self.get(source)
+        if job and (job['size'], job['mtime_ns'], job['backend'], job['model'], job['formats'],
+                    job['output_dir']) == (stat.st_size, stat.st_mtime_ns, backend, model, formats, output_dir):
+            if job['stage'] == "done" and self.outputs_exist(job):
+                return None
+            if job['stage'] == "transcribed" and self.outputs_exist(job):
+                return "transcribed"
+        now = time.time()
+        self.execute(
+            "INSERT INTO jobs (source, size, mtime_ns, backend, model, formats, output_dir, stage, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)"
+            " ON CONFLICT(source) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,"
+            " backend = excluded.backend, model = excluded.model, formats = excluded.formats,"
+            " output_dir = excluded.output_dir, stage = 'queued', outputs = NULL, notes_path = NULL,"
+            " error = NULL, updated = excluded.updated",
+            (source, stat.st_size, stat.st_mtime_ns, backend, model, ",".join(formats), output_dir, now, now))
+        return "queued"
+
+    @staticmethod
+    def outputs_exist(job):
+        paths = list(job['outputs'].values())
+        if job['stage'] == "done" and job['notes_path']:
+            paths.append(job['notes_path'])
+        return all(os.path.exists(path) for path in paths)
+
+    # The transcript write and notes generation finish in either order, so each
+    # records its part and the job is done once both parts are in
+    def transcribed(self, file_path, outputs, final=False):
+        """Transcripts written to outputs ({format: path}); final when no notes will follow"""
+        self.execute(
+            "UPDATE jobs SET outputs = ?, stage = CASE WHEN ? OR notes_path IS NOT NULL THEN 'done'"
+            " ELSE 'transcribed' END, updated = ? WHERE source = ? AND stage IN ('queued', 'transcribed')",
+            (json.dumps(outputs), final, time.time(), os.path.abspath(file_path)))
+
+    def notes_done(self, file_path, notes_path):
+        self.execute(
+            "UPDATE jobs SET notes_path = ?, stage = CASE WHEN outputs IS NOT NULL THEN 'done' ELSE stage END,"
+            " error = NULL, updated = ? WHERE source = ? AND stage IN ('queued', 'transcribed')",
+            (str(notes_path), time.time(), os.path.abspath(file_path)))
+
+    def notes_failed(self, file_path, error):
+        """Notes generation failed; the transcripts, if written, still count"""
+        self.execute("UPDATE jobs SET error = ?, attempts = attempts + 1, updated = ?"
+                     " WHERE source = ? AND stage IN ('queued', 'transcribed')",
+                     (str(error), time.time(), os.path.abspath(file_path)))
+
+    def fail(self, file_path, error):
+        self.execute("UPDATE jobs SET stage = 'failed', error = ?, attempts = attempts + 1, updated = ?"
+                     " WHERE source = ?", (str(error), time.time(), os.path.abspath(file_path)))
+
+    def pending(self):
+        """Unfinished jobs, oldest first"""
+        return self.query("SELECT * FROM jobs WHERE stage IN ('queued', 'transcribed') ORDER BY created")
+
+    def jobs(self, stage=None):
+        if stage:
+            return self.query("SELECT * FROM jobs WHERE stage = ? ORDER BY created", (stage,))
+        return self.query("SELECT * FROM jobs ORDER BY created")
+
+    def counts(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT stage, COUNT(*) FROM jobs GROUP BY stage").fetchall())
+        return {stage: counts.get(stage, 0) for stage in STAGES}
+
+    def clear(self, stages=("done",)):
+        """Forget jobs in the given stages; returns how many"""
+        marks = ",".join("?" * len(stages))
+        return self.execute(f"DELETE FROM jobs WHERE stage IN ({marks})", tuple(stages))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
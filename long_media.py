@@ -0,0 +1,155 @@
+import os
+import re
+import shutil
+import subprocess
+from collections import Counter
+
+import numpy as np
+
+__all__ = ['SAMPLE_RATE', 'decode_audio', 'find_split_points', 'write_chunks', 'stitch_results']
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+MIN_SILENCE_SECONDS = 0.3
+# Silent frames are at least 6 dB below the median frame, and must be a
+# minority of the recording for the gate to be trusted
+MAX_SILENCE_RATIO = 0.5
+MAX_SILENT_FRACTION = 0.5
+# When no silence is found near a boundary, chunks overlap by this much and
+# duplicated segments are dropped while stitching
+HARD_SPLIT_OVERLAP_SECONDS = 1.0
+DEDUPE_TOLERANCE_SECONDS = 0.2
+
+
+def decode_audio(file_path, sample_rate=SAMPLE_RATE):
+    """Decode any media file to mono float32 PCM with ffmpeg, as Whisper does"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found in PATH")
+    cmd = [
+        ffmpeg, "-nostdin", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-",
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode(errors='replace')}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def frame_energy(audio, sample_rate=SAMPLE_RATE):
+    frame = int(sample_rate * FRAME_SECONDS)
+    count = len(audio) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), frame
+    frames = audio[:count * frame].reshape(count, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1)), frame
+
+
+def silence_midpoints(audio, sample_rate=SAMPLE_RATE):
+    """Sample offsets at the middle of every silent stretch, via a simple
+    energy gate adapted to the recording's own noise floor. Returns none for
+    audio without real pauses (music, steady noise), where the gate would
+    otherwise take the whole recording for one long silence."""
+    rms, frame = frame_energy(audio, sample_rate)
+    if not len(rms):
+        return []
+    noise_floor = np.percentile(rms, 10)
+    median = np.percentile(rms, 50)
+    # Silence has to be clearly quieter than the typical frame, not just
+    # close to the noise floor
+    threshold = min(max(noise_floor * 2.0, median * 0.1, 1e-4), median * MAX_SILENCE_RATIO)
+    silent = rms < threshold
+    if silent.mean() > MAX_SILENT_FRACTION:
+        return []
+    min_frames = max(1, int(MIN_SILENCE_SECONDS / FRAME_SECONDS))
+
+    midpoints = []
+    run_start = None
+    for i, is_silent in enumerate(np.append(silent, False)):
+        if is_silent and run_start is None:
+            run_start = i
+        elif not is_silent and run_start is not None:
+            if i - run_start >= min_frames:
+                midpoints.append(((run_start + i) // 2) * frame)
+            run_start = None
+    return midpoints
+
+
+def find_split_points(audio, chunk_seconds, sample_rate=SAMPLE_RATE):
+    """Return (start, end) sample ranges of roughly chunk_seconds each.
+
+    Boundaries snap to the silence closest to each target length, searching
+    20% either side of it; where there is none the audio is cut hard and the
+    next chunk starts slightly earlier so no words are lost."""
+    target = int(chunk_seconds * sample_rate)
+    search = int(target * 0.2)
+    overlap = int(HARD_SPLIT_OVERLAP_SECONDS * sample_rate)
+    total = len(audio)
+    candidates = np.array(silence_midpoints(audio, sample_rate), dtype=np.int64)
+
+    ranges = []
+    start = 0
+    while total - start > target + search:
+        goal = start + target
+        nearby = candidates[(candidates >= goal - search) & (candidates <= goal + search)]
+        if len(nearby):
+            end = int(nearby[np.argmin(np.abs(nearby - goal))])
+            ranges.append((start, end))
+            start = end
+        else:
+            ranges.append((start, goal))
+            start = goal - overlap
+    ranges.append((start, total))
+    return ranges
+
+
+def write_chunks(audio, ranges, chunk_dir, prefix="chunk", sample_rate=SAMPLE_RATE):
+    """Save each range as a .npy file; returns [(path, offset_seconds)]"""
+    os.makedirs(chunk_dir, exist_ok=True)
+    chunks = []
+    for i, (start, end) in enumerate(ranges):
+        path = os.path.join(chunk_dir, f"{prefix}-{i:04d}.npy")
+        np.save(path, np.ascontiguousarray(audio[start:end]))
+        chunks.append((path, start / sample_rate))
+    return chunks
+
+
+def _normalise(text):
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+
+def stitch_results(results, offsets):
+    """Merge per-chunk Whisper results into one result for the whole file.
+
+    Timestamps (including word timestamps, when present) are shifted by each
+    chunk's offset, and segments repeated in the overlap after a hard split
+    are dropped."""
+    segments = []
+    covered_until = 0.0
+    for result, offset in zip(results, offsets):
+        for segment in result.get('segments', []):
+            start = segment['start'] + offset
+            end = segment['end'] + offset
+            if segments and start < covered_until - DEDUPE_TOLERANCE_SECONDS:
+                previous = segments[-1]
+                if end <= covered_until + DEDUPE_TOLERANCE_SECONDS or \
+                        _normalise(segment['text']) == _normalise(previous['text']):
+                    continue
+            stitched = dict(segment, id=len(segments), start=round(start, 3), end=round(end, 3))
+            if 'seek' in segment:
+                stitched['seek'] = segment['seek'] + int(offset * 100)
+            if segment.get('words'):
+                stitched['words'] = [
+                    dict(word, start=round(word['start'] + offset, 3), end=round(word['end'] + offset, 3))
+                    for word in segment['words']
+                ]
+            segments.append(stitched)
+            covered_until = max(covered_until, end)
+
+    languages = Counter(result.get('language', 'unknown') for result in results)
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': languages.most_common(1)[0][0] if languages else 'unknown',
+    }
@@ -0,0 +1,261 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows; peak memory is reported as None there
+    resource = None
+
+__all__ = ['peak_rss_mb', 'percentile', 'FileMetrics', 'PipelineMetrics']
+
+# HELP text for the Prometheus counters of FileMetrics.count() names
+COUNTER_HELP = {
+    'llm_requests': "Gemini requests answered",
+    'llm_cached': "Gemini responses served from the notes cache",
+    'prompt_tokens': "Prompt tokens sent to Gemini",
+    'response_tokens': "Response tokens received from Gemini",
+    'transcript_cache_hits': "Transcriptions served from the transcription cache",
+}
+
+# Durations kept per stage for the percentiles in summary(), so a long watch stays bounded
+RECENT_SAMPLES = 1024
+
+
+def peak_rss_mb():
+    """This process's peak resident set size so far, in MB (None where unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 3)
+
+
+class FileMetrics:
+    """What one file cost on its way through the pipeline. Stages add to it
+    from their own threads; PipelineMetrics.finish() turns it into a record.
+
+    stages holds seconds per stage, counts things that add up (LLM tokens,
+    requests) and gauges the highest value seen (queue depths, worker memory)."""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.started = time.time()
+        self.audio_seconds = None
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counts = {}
+        self.gauges = {}
+
+    def timing(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        if value is None:
+            return
+        with self.lock:
+            self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def llm_usage(self, prompt_tokens, response_tokens):
+        """GeminiClient's on_usage callback"""
+        with self.lock:
+            for name, amount in (('llm_requests', 1), ('prompt_tokens', prompt_tokens),
+                                 ('response_tokens', response_tokens)):
+                self.counts[name] = self.counts.get(name, 0) + amount
+
+    def record(self, ok):
+        with self.lock:
+            # A cached transcription says nothing about transcription speed
+            transcribe = None if self.counts.get('transcript_cache_hits') else self.stages.get('transcribe')
+            record = {
+                'file': self.file_path,
+                'ok': ok,
+                'started': round(self.started, 3),
+                'wall_seconds': round(time.time() - self.started, 3),
+                'audio_seconds': round(self.audio_seconds, 3) if self.audio_seconds else None,
+                # Seconds of audio transcribed per second spent transcribing
+                'speed': round(self.audio_seconds / transcribe, 2) if self.audio_seconds and transcribe else None,
+                'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            }
+            record.update(self.counts)
+            record.update(self.gauges)
+        record['peak_rss_mb'] = peak_rss_mb()
+        return record
+
+
+class PipelineMetrics:
+    """Per-file stage latencies, throughput, queue depths, LLM tokens and
+    memory for every file the pipeline finishes.
+
+    Each finished file becomes one record, appended to `path` as a JSON line
+    and passed to on_record(record). With prometheus_path, running totals are
+    rewritten there after every file in the Prometheus text format, for
+    node_exporter's textfile collector. summary() aggregates everything
+    finished so far."""
+    def __init__(self, path=None, prometheus_path=None, on_record=None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.on_record = on_record
+        self.lock = threading.Lock()
+        self.files = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.finished = 0
+            self.failed = 0
+            self.first_started = None
+            self.last_finished = None
+            self.audio_seconds = 0.0
+            self.stage_totals = {}
+            self.stage_recent = {}
+            self.counts = {}
+            self.gauges = {}
+
+    def file(self, file_path):
+        with self.lock:
+            metrics = self.files.get(file_path)
+            if metrics is None:
+                metrics = self.files[file_path] = FileMetrics(file_path)
+            return metrics
+
+    def start(self, file_path):
+        """Mark when work on file_path began; its wall_seconds count from here.
+        Stages may have added to it before, e.g. by decoding it ahead of time."""
+        self.file(file_path).started = time.time()
+
+    def timing(self, file_path, stage, seconds):
+        self.file(file_path).timing(stage, seconds)
+
+    def finish(self, file_path, ok):
+        """Close file_path's record, export it and return it"""
+        with self.lock:
+            metrics = self.files.pop(file_path, None) or FileMetrics(file_path)
+        record = metrics.record(ok)
+        with self.lock:
+            self.add(metrics, record)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print(f"Warning: could not write metrics: {e}", file=sys.stderr)
+            if self.prometheus_path:
+                self.write_prometheus(self.prometheus_path)
+        if self.on_record:
+            self.on_record(record)
+        return record
+
+    def add(self, metrics, record):
+        self.finished += 1
+        self.failed += not record['ok']
+        started = record['started']
+        self.first_started = started if self.first_started is None else min(self.first_started, started)
+        self.last_finished = max(self.last_finished or 0.0, started + record['wall_seconds'])
+        self.audio_seconds += record['audio_seconds'] or 0.0
+        for stage, seconds in record['stages'].items():
+            count, total, longest = self.stage_totals.get(stage, (0, 0.0, 0.0))
+            self.stage_totals[stage] = (count + 1, total + seconds, max(longest, seconds))
+            self.stage_recent.setdefault(stage, deque(maxlen=RECENT_SAMPLES)).append(seconds)
+        for name, value in metrics.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+        for name, value in metrics.gauges.items():
+            self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def summary(self):
+        with self.lock:
+            wall = (self.last_finished - self.first_started) if self.finished else 0.0
+            stages = {}
+            for stage, (count, total, longest) in self.stage_totals.items():
+                recent = self.stage_recent[stage]
+                stages[stage] = {
+                    'files': count,
+                    'total_seconds': round(total, 3),
+                    'mean_seconds': round(total / count, 3),
+                    'p50_seconds': percentile(recent, 0.5),
+                    'p95_seconds': percentile(recent, 0.95),
+                    'max_seconds': round(longest, 3),
+                }
+            summary = {
+                'files': self.finished,
+                'failed': self.failed,
+                'wall_seconds': round(wall, 3),
+                'audio_seconds': round(self.audio_seconds, 3),
+                'audio_seconds_per_second': round(self.audio_seconds / wall, 2) if wall > 0 else None,
+                'stages': stages,
+            }
+            summary.update(self.counts)
+            summary.update(self.gauges)
+        summary['peak_rss_mb'] = peak_rss_mb()
+        return summary
+
+    def format_summary(self):
+        summary = self.summary()
+        parts = [f"{stage} {stats['mean_seconds']}s mean, {stats['p95_seconds']}s p95"
+                 for stage, stats in summary['stages'].items()]
+        line = f"Per-file metrics - {summary['files']} files, {summary['audio_seconds']}s audio"
+        if summary['audio_seconds_per_second'] is not None:
+            line += f" at {summary['audio_seconds_per_second']}x real time"
+        line += "".join(f" | {part}" for part in parts)
+        if summary.get('prompt_tokens') is not None:
+            line += f" | {summary['prompt_tokens']} prompt / {summary.get('response_tokens', 0)} response tokens"
+        if summary['peak_rss_mb'] is not None:
+            line += f" | peak {summary['peak_rss_mb']} MB"
+        return line
+
+    def prometheus_lines(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP noter_{name} {help_text}")
+            lines.append(f"# TYPE noter_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"noter_{name}{{{label_text}}} {value}" if label_text else f"noter_{name} {value}")
+
+        metric("files_total", "counter", "Files finished by the pipeline",
+               [({'result': 'ok'}, self.finished - self.failed), ({'result': 'failed'}, self.failed)])
+        metric("audio_seconds_total", "counter", "Seconds of media transcribed", [({}, round(self.audio_seconds, 3))])
+        metric("stage_seconds_total", "counter", "Seconds spent per pipeline stage",
+               [({'stage': stage}, round(total, 3)) for stage, (_, total, _) in self.stage_totals.items()])
+        metric("stage_files_total", "counter", "Files that went through each pipeline stage",
+               [({'stage': stage}, count) for stage, (count, _, _) in self.stage_totals.items()])
+        metric("stage_max_seconds", "gauge", "Longest time one file spent in each pipeline stage",
+               [({'stage': stage}, round(longest, 3)) for stage, (_, _, longest) in self.stage_totals.items()])
+        for name, value in self.counts.items():
+            metric(f"{name}_total", "counter", COUNTER_HELP.get(name, name.replace('_', ' ')), [({}, value)])
+        for name, value in self.gauges.items():
+            metric(f"{name}_max", "gauge", f"Highest {name.replace('_', ' ')} seen", [({}, value)])
+        peak = peak_rss_mb()
+        if peak is not None:
+            metric("peak_rss_bytes", "gauge", "Peak resident memory of the pipeline process",
+                   [({}, int(peak * 1024 * 1024))])
+        if self.last_finished is not None:
+            metric("last_finished_timestamp_seconds", "gauge", "When the last file finished",
+                   [({}, round(self.last_finished, 3))])
+        return lines
+
+    def write_prometheus(self, path):
+        # Written aside and renamed so the collector never reads a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(self.prometheus_lines()) + "\n")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write Prometheus metrics: {e}", file=sys.stderr)
@@ -0,0 +1,82 @@
+import gc
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from backends import estimate_bytes, load_model
+
+__all__ = ['ModelPool']
+
+
+class ModelPool:
+    """Resident transcription models, loaded in the background and evicted LRU.
+
+    Up to max_models stay loaded as long as their estimated size fits in
+    max_bytes (0 = no byte limit), so switching back to a recently used model
+    is instant. Loads run one at a time on a single thread so two large models
+    never materialise at once. A model evicted while a transcription still
+    holds it is freed when that transcription finishes."""
+    def __init__(self, backend, max_models=2, max_bytes=0):
+        self.backend = backend
+        self.max_models = max(1, max_models)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.models = OrderedDict()
+        self.loading = {}
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    def warm(self, model_name):
+        """Start loading model_name in the background; returns a future for it"""
+        with self.lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                future = Future()
+                future.set_result(self.models[model_name])
+            else:
+                future = self.loading.get(model_name)
+                if future is None:
+                    future = self.loader.submit(self.load, model_name)
+                    self.loading[model_name] = future
+        return future
+
+    def get(self, model_name):
+        """The loaded model, waiting for (or starting) its load if needed"""
+        with self.lock:
+            model = self.models.get(model_name)
+            if model is not None:
+                self.models.move_to_end(model_name)
+                return model
+        return self.warm(model_name).result()
+
+    def is_resident(self, model_name):
+        with self.lock:
+            return model_name in self.models
+
+    def load(self, model_name):
+        try:
+            with self.lock:
+                model = self.models.get(model_name)
+                if model is not None:
+                    return model
+                self.make_room(estimate_bytes(self.backend, model_name))
+            gc.collect()
+            model = load_model(self.backend, model_name)
+            with self.lock:
+                self.models[model_name] = model
+            return model
+        finally:
+            with self.lock:
+                self.loading.pop(model_name, None)
+
+    def make_room(self, incoming_bytes):
+        """Evict least recently used models until one more of incoming_bytes fits"""
+        def over_budget():
+            if len(self.models) + 1 > self.max_models:
+                return True
+            if not self.max_bytes:
+                return False
+            used = sum(estimate_bytes(self.backend, name) for name in self.models)
+            return used + incoming_bytes > self.max_bytes
+
+        while self.models and over_budget():
+            self.models.popitem(last=False)
@@ -0,0 +1,419 @@
+"""Headless command line entry point for Noter.
+
+Runs the transcription + notes pipeline without loading any GUI toolkit, so it
+works on servers with no display. Progress is streamed to stdout as JSON lines.
+
+    python noter.py transcribe lectures/ "talks/**/*.mp4" --model small --format srt,txt --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+
+from backends import BACKENDS
+from job_store import STAGES
+from transcript_writer import FORMATS, parse_formats
+from utils import collect_media_files
+
+MODELS = ["tiny", "base", "small", "medium", "large"]
+
+
+def format_list(value):
+    try:
+        return parse_formats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def cmd_transcribe(args):
+    from headless import run_batch
+
+    files = collect_media_files(args.inputs, recursive=args.recursive)
+    if not files and not args.resume:
+        print(json.dumps({"event": "error", "message": "No media files matched the given inputs."}))
+        return 2
+    notes_options = {}
+    if args.chunk_tokens is not None:
+        notes_options['chunk_tokens'] = args.chunk_tokens
+    if args.chunk_concurrency is not None:
+        notes_options['chunk_concurrency'] = args.chunk_concurrency
+    if args.two_call_notes:
+        notes_options['single_call'] = False
+    if args.stream_notes:
+        notes_options['stream'] = True
+    print(json.dumps({"event": "batch_started", "files": len(files), "workers": args.workers}), flush=True)
+    failed = run_batch(
+        files,
+        workers=args.workers,
+        model_name=args.model,
+        output_format=args.format or ["srt"],
+        output_dir=args.output_dir,
+        notes=not args.no_notes,
+        notes_concurrency=args.notes_concurrency,
+        notes_queue_size=args.notes_queue,
+        use_cache=not args.no_cache,
+        notes_options=notes_options,
+        long_media_seconds=args.long_media_seconds,
+        backend=args.backend,
+        jobs=not args.no_jobs,
+        resume=args.resume,
+        metrics_path=args.metrics,
+        prometheus_path=args.prometheus,
+    )
+    print(json.dumps({"event": "batch_finished", "files": len(files), "failed": failed}), flush=True)
+    return 1 if failed else 0
+
+
+def cmd_watch(args):
+    import signal
+    import threading
+
+    from headless import run_watch
+
+    # Stop cleanly (final stats included) when a service manager asks us to
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(json.dumps({"event": "watch_requested", "directories": args.directories}), flush=True)
+    failed = run_watch(
+        args.directories,
+        workers=args.workers,
+        model_name=args.model,
+        output_format=args.format or ["srt"],
+        output_dir=args.output_dir,
+        recursive=args.recursive,
+        settle_seconds=args.settle_seconds,
+        poll_interval=args.poll_interval,
+        skip_existing=args.skip_existing,
+        polling=args.polling,
+        notes=not args.no_notes,
+        notes_concurrency=args.notes_concurrency,
+        notes_queue_size=args.notes_queue,
+        use_cache=not args.no_cache,
+        backend=args.backend,
+        jobs=not args.no_jobs,
+        metrics_path=args.metrics,
+        prometheus_path=args.prometheus,
+        stop=stop,
+    )
+    return 1 if failed else 0
+
+
+def cmd_profile(args):
+    import cProfile
+    import pstats
+
+    from headless import run_batch
+
+    if not os.path.isfile(args.file):
+        print(json.dumps({"event": "error", "message": f"No such file: {args.file}"}))
+        return 2
+    # The pid lets a sampling profiler attach: py-spy record --pid <pid>
+    print(json.dumps({"event": "profile_started", "file": args.file, "pid": os.getpid()}), flush=True)
+    # In-process and uncached, so the transcription itself runs on this thread
+    options = dict(workers=1, model_name=args.model, output_format=args.format or ["srt"],
+                   output_dir=args.output_dir, notes=not args.no_notes, use_cache=False, backend=args.backend,
+                   jobs=False, metrics_path=args.metrics)
+    if args.no_cprofile:
+        return 1 if run_batch([args.file], **options) else 0
+    profiler = cProfile.Profile()
+    failed = profiler.runcall(run_batch, [args.file], **options)
+    profiler.dump_stats(args.output)
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:args.top]
+    for (filename, line, name), (_, calls, own, cumulative, _) in top:
+        print(json.dumps({"event": "profile_function", "function": f"{filename}:{line}({name})", "calls": calls,
+                          "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)}))
+    print(json.dumps({"event": "profile_written", "path": args.output}), flush=True)
+    return 1 if failed else 0
+
+
+def cmd_benchmark(args):
+    from benchmark import run_benchmark
+
+    files = collect_media_files(args.inputs, recursive=args.recursive)
+    if not files:
+        print(json.dumps({"event": "error", "message": "No media files matched the given inputs."}))
+        return 2
+    failed = 0
+    for row in run_benchmark(files, args.backends, args.models, language=args.language):
+        print(json.dumps(row), flush=True)
+        failed += 'error' in row
+    return 1 if failed else 0
+
+
+def cmd_startup(args):
+    from benchmark import measure_startup
+
+    failed = 0
+    for row in measure_startup(args.modules, runs=args.runs, top=args.top):
+        over_budget = args.budget_ms is not None and row.get('import_ms', 0) > args.budget_ms
+        if over_budget:
+            row['over_budget_ms'] = round(row['import_ms'] - args.budget_ms, 1)
+        print(json.dumps(row), flush=True)
+        failed += 'error' in row or over_budget
+    return 1 if failed else 0
+
+
+def cmd_writers(args):
+    from benchmark import measure_writers
+
+    for row in measure_writers(segments=args.segments, repeat=args.repeat):
+        print(json.dumps(row), flush=True)
+    return 0
+
+
+def cmd_gemini(args):
+    from benchmark import measure_notes_client
+
+    for row in measure_notes_client(
+            requests=args.requests, callers=args.callers, concurrency=args.concurrency,
+            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, latency=args.latency,
+            failure_rate=args.failure_rate, quota_per_minute=args.quota, prompt_tokens=args.prompt_tokens):
+        print(json.dumps(row), flush=True)
+    return 0
+
+
+def cmd_cache(args):
+    from config import (TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB, NOTES_CACHE_DIR, NOTES_CACHE_MAX_MB,
+                        PCM_CACHE_DIR, PCM_CACHE_MAX_MB)
+    from disk_cache import DiskCache
+
+    if args.notes:
+        cache = DiskCache(NOTES_CACHE_DIR, NOTES_CACHE_MAX_MB * 1024 * 1024)
+    elif args.pcm:
+        from pcm_cache import PcmCache
+        cache = PcmCache(PCM_CACHE_DIR, PCM_CACHE_MAX_MB * 1024 * 1024)
+    else:
+        cache = DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+    if args.action == "info":
+        files = cache.files()
+        print(json.dumps({
+            "dir": str(cache.cache_dir),
+            "entries": len(files),
+            "bytes": sum(stat.st_size for _, stat in files),
+            "max_bytes": cache.max_bytes,
+        }))
+    elif args.action == "list":
+        for entry in cache.entries():
+            print(json.dumps(entry, ensure_ascii=False))
+    elif args.action == "purge":
+        if args.max_mb is not None:
+            removed = cache.evict(args.max_mb * 1024 * 1024)
+        else:
+            removed = cache.purge(older_than_days=args.older_than)
+        print(json.dumps({"removed": removed, "bytes": cache.size()}))
+    return 0
+
+
+def cmd_jobs(args):
+    from config import JOB_STORE_PATH
+    from job_store import JobStore
+
+    if not JOB_STORE_PATH:
+        print(json.dumps({"event": "error", "message": "The job store is disabled (JOB_STORE_PATH is empty)."}))
+        return 2
+    jobs = JobStore(JOB_STORE_PATH)
+    if args.action == "info":
+        print(json.dumps({"path": str(jobs.path), **jobs.counts()}))
+    elif args.action == "list":
+        for job in jobs.jobs(args.stage):
+            print(json.dumps(job, ensure_ascii=False))
+    elif args.action == "clear":
+        stages = [args.stage] if args.stage else ["done"]
+        print(json.dumps({"removed": jobs.clear(stages), **jobs.counts()}))
+    jobs.close()
+    return 0
+
+
+def open_search_index():
+    from config import SEARCH_INDEX_PATH
+    from search_index import SearchIndex
+
+    if not SEARCH_INDEX_PATH:
+        print(json.dumps({"event": "error", "message": "The search index is disabled (SEARCH_INDEX_PATH is empty)."}))
+        return None
+    return SearchIndex(SEARCH_INDEX_PATH)
+
+
+def cmd_search(args):
+    import sqlite3
+
+    index = open_search_index()
+    if index is None:
+        return 2
+    try:
+        hits = index.search(" ".join(args.query), kind=args.kind, limit=args.limit, raw=args.raw)
+    except (ValueError, sqlite3.OperationalError) as e:
+        print(json.dumps({"event": "error", "message": f"Bad query: {e}"}))
+        return 2
+    finally:
+        index.close()
+    for hit in hits:
+        print(json.dumps(hit, ensure_ascii=False))
+    # Like grep: 1 when nothing matched
+    return 0 if hits else 1
+
+
+def cmd_index(args):
+    from config import JOB_STORE_PATH, NOTES_OUTPUT_DIR
+
+    index = open_search_index()
+    if index is None:
+        return 2
+    if args.action == "info":
+        print(json.dumps(index.stats()))
+    elif args.action == "clear":
+        index.clear()
+        print(json.dumps(index.stats()))
+    elif args.action == "reindex":
+        # The job store knows which recording each output came from
+        sources = {}
+        if JOB_STORE_PATH and os.path.exists(JOB_STORE_PATH):
+            from job_store import JobStore
+
+            jobs = JobStore(JOB_STORE_PATH)
+            for job in jobs.jobs():
+                for path in list(job['outputs'].values()) + [job['notes_path']]:
+                    if path:
+                        sources[path] = job['source']
+            jobs.close()
+        roots = args.paths or [str(NOTES_OUTPUT_DIR)]
+        counts = index.reindex(roots, force=args.force, sources=sources)
+        print(json.dumps({**counts, **index.stats()}))
+    index.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="noter", description="Headless video transcriber and notes generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    transcribe = subparsers.add_parser("transcribe", help="Transcribe files, directories or glob patterns")
+    transcribe.add_argument("inputs", nargs="*", help="Media files, directories or glob patterns")
+    transcribe.add_argument("-m", "--model", default="small", choices=MODELS, help="Whisper model (default: small)")
+    transcribe.add_argument("-b", "--backend", choices=BACKENDS, help="Transcription engine (default: TRANSCRIBE_BACKEND or whisper)")
+    transcribe.add_argument("-f", "--format", type=format_list, action="extend", metavar="FORMAT",
+                            help=f"Transcript formats, comma-separated or repeated; all are written from one transcription ({', '.join(FORMATS)}; default: srt)")
+    transcribe.add_argument("-o", "--output-dir", default="", help="Transcript directory (default: next to each input)")
+    transcribe.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes (default: 1)")
+    transcribe.add_argument("--long-media-seconds", type=int, help="With several workers, split files at least this long into chunks transcribed in parallel, 0 disables (default: LONG_MEDIA_SECONDS or 1200)")
+    transcribe.add_argument("-r", "--recursive", action="store_true", help="Descend into subdirectories")
+    transcribe.add_argument("--no-notes", action="store_true", help="Skip Gemini notes generation")
+    transcribe.add_argument("--notes-concurrency", type=int, help="Parallel notes requests (default: NOTES_CONCURRENCY or 2)")
+    transcribe.add_argument("--notes-queue", type=int, help="Transcripts that may wait for notes before transcription pauses (default: NOTES_QUEUE_SIZE or 4)")
+    transcribe.add_argument("--chunk-tokens", type=int, help="Map-reduce notes for transcripts above this many tokens, 0 disables (default: NOTES_CHUNK_TOKENS or 12000)")
+    transcribe.add_argument("--chunk-concurrency", type=int, help="Parallel partial-notes requests per file (default: NOTES_CHUNK_CONCURRENCY or 4)")
+    transcribe.add_argument("--two-call-notes", action="store_true", help="Request title and notes separately instead of as one JSON response")
+    transcribe.add_argument("--stream-notes", action="store_true", help="Stream notes to the .md file and output events as they are generated")
+    transcribe.add_argument("--no-cache", action="store_true", help="Ignore and don't update the transcription, decoded audio and notes caches")
+    transcribe.add_argument("--resume", action="store_true", help="Also finish every job an interrupted run left unfinished, with its original settings")
+    transcribe.add_argument("--no-jobs", action="store_true", help="Don't record jobs, and redo files an earlier run already finished")
+    transcribe.add_argument("--metrics", metavar="FILE", help="Append each file's stage timings, tokens and memory as JSON lines (default: METRICS_PATH)")
+    transcribe.add_argument("--prometheus", metavar="FILE", help="Keep running totals in this Prometheus textfile (default: METRICS_PROMETHEUS_PATH)")
+    transcribe.set_defaults(func=cmd_transcribe)
+
+    watch = subparsers.add_parser("watch", help="Transcribe media as it lands in one or more directories, until interrupted")
+    watch.add_argument("directories", nargs="+", help="Directories to watch")
+    watch.add_argument("-m", "--model", default="small", choices=MODELS, help="Whisper model (default: small)")
+    watch.add_argument("-b", "--backend", choices=BACKENDS, help="Transcription engine (default: TRANSCRIBE_BACKEND or whisper)")
+    watch.add_argument("-f", "--format", type=format_list, action="extend", metavar="FORMAT",
+                       help=f"Transcript formats, comma-separated or repeated ({', '.join(FORMATS)}; default: srt)")
+    watch.add_argument("-o", "--output-dir", default="", help="Transcript directory (default: next to each input)")
+    watch.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes (default: 1)")
+    watch.add_argument("-r", "--recursive", action="store_true", help="Also watch subdirectories, including new ones")
+    watch.add_argument("--settle-seconds", type=float, default=5.0, help="How long a file must stop changing before it is taken (default: 5)")
+    watch.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between checks for settled files, and between rescans when polling (default: 2)")
+    watch.add_argument("--skip-existing", action="store_true", help="Ignore files already there when watching starts")
+    watch.add_argument("--polling", action="store_true", help="Rescan the directories instead of using inotify")
+    watch.add_argument("--no-notes", action="store_true", help="Skip Gemini notes generation")
+    watch.add_argument("--notes-concurrency", type=int, help="Parallel notes requests (default: NOTES_CONCURRENCY or 2)")
+    watch.add_argument("--notes-queue", type=int, help="Transcripts that may wait for notes before transcription pauses (default: NOTES_QUEUE_SIZE or 4)")
+    watch.add_argument("--no-cache", action="store_true", help="Ignore and don't update the transcription, decoded audio and notes caches")
+    watch.add_argument("--no-jobs", action="store_true", help="Don't record jobs, and redo files an earlier run already finished")
+    watch.add_argument("--metrics", metavar="FILE", help="Append each file's stage timings, tokens and memory as JSON lines (default: METRICS_PATH)")
+    watch.add_argument("--prometheus", metavar="FILE", help="Keep running totals in this Prometheus textfile (default: METRICS_PROMETHEUS_PATH)")
+    watch.set_defaults(func=cmd_watch)
+
+    profile = subparsers.add_parser("profile", help="Transcribe one file in-process under cProfile to find where its time goes")
+    profile.add_argument("file", help="Media file to profile")
+    profile.add_argument("-m", "--model", default="small", choices=MODELS, help="Whisper model (default: small)")
+    profile.add_argument("-b", "--backend", choices=BACKENDS, help="Transcription engine (default: TRANSCRIBE_BACKEND or whisper)")
+    profile.add_argument("-f", "--format", type=format_list, action="extend", metavar="FORMAT",
+                         help=f"Transcript formats, comma-separated or repeated ({', '.join(FORMATS)}; default: srt)")
+    profile.add_argument("-o", "--output-dir", default="", help="Transcript directory (default: next to the input)")
+    profile.add_argument("--output", default="noter.prof", help="Where to write the pstats file, e.g. for snakeviz (default: noter.prof)")
+    profile.add_argument("--top", type=int, default=25, help="Functions to list by cumulative time (default: 25)")
+    profile.add_argument("--no-notes", action="store_true", help="Skip Gemini notes generation")
+    profile.add_argument("--no-cprofile", action="store_true", help="Run without cProfile, for an external sampler such as py-spy")
+    profile.add_argument("--metrics", metavar="FILE", help="Also append the file's metrics record here as a JSON line")
+    profile.set_defaults(func=cmd_profile)
+
+    search = subparsers.add_parser("search", help="Full-text search over the notes and transcripts written so far")
+    search.add_argument("query", nargs="+", help="Words that must all appear; end one with * to match prefixes")
+    search.add_argument("-k", "--kind", choices=["notes", "transcript"], help="Only search notes or transcripts")
+    search.add_argument("-n", "--limit", type=int, default=20, help="Most hits to list (default: 20)")
+    search.add_argument("--raw", action="store_true", help="Pass the query to SQLite FTS5 as-is (phrases, OR, NEAR, column filters)")
+    search.set_defaults(func=cmd_search)
+
+    index = subparsers.add_parser("index", help="Inspect, rebuild or clear the search index")
+    index.add_argument("action", choices=["info", "reindex", "clear"])
+    index.add_argument("paths", nargs="*", help="reindex: files or directories to add, searched recursively (default: NOTES_OUTPUT_DIR); indexed files are always refreshed")
+    index.add_argument("--force", action="store_true", help="reindex: reread files even if unchanged")
+    index.set_defaults(func=cmd_index)
+
+    jobs = subparsers.add_parser("jobs", help="Inspect or clear the job store")
+    jobs.add_argument("action", choices=["info", "list", "clear"])
+    jobs.add_argument("--stage", choices=STAGES, help="list/clear: only jobs in this stage (clear defaults to done)")
+    jobs.set_defaults(func=cmd_jobs)
+
+    cache = subparsers.add_parser("cache", help="Inspect or purge the transcription (or notes) cache")
+    cache.add_argument("action", choices=["info", "list", "purge"])
+    which = cache.add_mutually_exclusive_group()
+    which.add_argument("--notes", action="store_true", help="Operate on the Gemini response cache instead")
+    which.add_argument("--pcm", action="store_true", help="Operate on the decoded audio cache instead")
+    cache.add_argument("--older-than", type=float, metavar="DAYS", help="purge: only entries unused for this many days")
+    cache.add_argument("--max-mb", type=int, help="purge: evict least recently used entries down to this size")
+    cache.set_defaults(func=cmd_cache)
+
+    benchmark = subparsers.add_parser("benchmark", help="Compare real-time factor and peak memory across backends and models")
+    benchmark.add_argument("inputs", nargs="+", help="Media files, directories or glob patterns making up the corpus")
+    benchmark.add_argument("-b", "--backends", nargs="+", default=BACKENDS, choices=BACKENDS, help="Backends to compare (default: all)")
+    benchmark.add_argument("-m", "--models", nargs="+", default=["tiny", "base", "small"], choices=MODELS, help="Model sizes to compare (default: tiny base small)")
+    benchmark.add_argument("-l", "--language", help="Skip language detection, e.g. en")
+    benchmark.add_argument("-r", "--recursive", action="store_true", help="Descend into subdirectories")
+    benchmark.set_defaults(func=cmd_benchmark)
+
+    startup = subparsers.add_parser("startup", help="Measure import time of the app's entry modules")
+    startup.add_argument("modules", nargs="*", default=["ui_components", "transcription_manager", "noter"], help="Modules to import (default: ui_components transcription_manager noter)")
+    startup.add_argument("-n", "--runs", type=int, default=5, help="Fresh interpreters per module; the median is reported (default: 5)")
+    startup.add_argument("--top", type=int, default=10, help="Slowest top-level packages to list (default: 10)")
+    startup.add_argument("--budget-ms", type=float, help="Exit non-zero if any module takes longer than this to import")
+    startup.set_defaults(func=cmd_startup)
+
+    writers = subparsers.add_parser("writers", help="Micro-benchmark transcript writers on a synthetic transcript")
+    writers.add_argument("-n", "--segments", type=int, default=20000, help="Segments in the synthetic transcript (default: 20000)")
+    writers.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best is reported (default: 5)")
+    writers.set_defaults(func=cmd_writers)
+
+    gemini = subparsers.add_parser("gemini", help="Load-test the Gemini client against an offline fake model")
+    gemini.add_argument("-n", "--requests", type=int, default=40, help="Requests to send (default: 40)")
+    gemini.add_argument("--callers", type=int, default=8, help="Threads sending them (default: 8)")
+    gemini.add_argument("--concurrency", type=int, default=4, help="Client's in-flight request limit (default: 4)")
+    gemini.add_argument("--rpm", type=int, default=0, help="Client's requests per minute, 0 for unlimited (default: 0)")
+    gemini.add_argument("--tpm", type=int, default=0, help="Client's tokens per minute, 0 for unlimited (default: 0)")
+    gemini.add_argument("--latency", type=float, default=0.2, help="Fake model's seconds per request (default: 0.2)")
+    gemini.add_argument("--failure-rate", type=float, default=0.1, help="Fraction of requests the fake fails with 503 (default: 0.1)")
+    gemini.add_argument("--quota", type=int, default=0, help="Fake model's requests per minute before it answers 429 (default: unlimited)")
+    gemini.add_argument("--prompt-tokens", type=int, default=2000, help="Approximate tokens per prompt (default: 2000)")
+    gemini.set_defaults(func=cmd_gemini)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,227 @@
-import google.generativeai as genai
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from config import GEMINI_API_KEY, NOTES_OUTPUT_DIR
+from config import (GEMINI_API_KEY, NOTES_OUTPUT_DIR, NOTES_CACHE_DIR, NOTES_CACHE_MAX_MB,
+                    NOTES_CACHE_TTL_DAYS, NOTES_CHUNK_TOKENS, NOTES_CHUNK_OVERLAP_TOKENS,
+                    NOTES_CHUNK_CONCURRENCY, NOTES_SINGLE_CALL, NOTES_STREAM, GEMINI_REQUESTS_PER_MINUTE,
+                    GEMINI_TOKENS_PER_MINUTE, GEMINI_CONCURRENCY, GEMINI_TIMEOUT_SECONDS, GEMINI_MAX_RETRIES,
+                    GEMINI_BACKOFF_SECONDS, GEMINI_BACKOFF_MAX_SECONDS, GEMINI_FAKE)
+from disk_cache import DiskCache, cache_key
+from chunking import estimate_tokens, segments_from_text, split_into_windows, window_label
+from pipeline import StageStats
+from gemini_client import GeminiClient
 import re
 
 __all__ = ['NotesManager']
 
-class NotesManager:
+# Bump whenever a prompt below changes so cached responses for the old prompt are ignored
+PROMPT_VERSION = 2
+
+class MarkdownStreamCleaner:
+    """Incremental version of NotesManager.clean_markdown_content.
+
+    feed() takes raw response chunks and returns the complete lines that are
+    safe to emit. Leading fences/blank lines are dropped as they arrive, and
+    blank or fence-only lines are held back until more content follows, so a
+    closing fence at the very end never gets written."""
+    FENCE = re.compile(r'^`+(markdown)?\s*$')
+
     def __init__(self):
-        if not GEMINI_API_KEY:
-            raise ValueError("Gemini API key not configured")
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(
-            model_name='gemini-2.0-flash-thinking-exp-01-21',
-            generation_config={
-                'temperature': 0.7,
-                'top_p': 0.9,
-                'max_output_tokens': 8000,
-            }
+        self.buffer = ""
+        self.started = False
+        self.pending = []
+
+    def feed(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        return self.push(lines)
+
+    def finish(self):
+        lines = self.push([self.buffer.rstrip('`')] if self.buffer.strip('`').strip() else [])
+        self.buffer = ""
+        self.pending = []
+        return lines
+
+    def push(self, lines):
+        out = []
+        for line in lines:
+            is_filler = not line.strip() or self.FENCE.match(line)
+            if not self.started:
+                if is_filler:
+                    continue
+                self.started = True
+                line = line.lstrip('`')
+            if is_filler:
+                self.pending.append(line)
+                continue
+            out.extend(self.pending)
+            self.pending = []
+            out.append(line)
+        return out
+
+class NotesManager:
+    def __init__(self, use_cache=True, chunk_tokens=NOTES_CHUNK_TOKENS,
+                 chunk_overlap_tokens=NOTES_CHUNK_OVERLAP_TOKENS, chunk_concurrency=NOTES_CHUNK_CONCURRENCY,
+                 single_call=NOTES_SINGLE_CALL, stream=NOTES_STREAM, fake=GEMINI_FAKE):
+        if not GEMINI_API_KEY and not fake:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        # Fake responses get their own cache entries
+        self.model_name = 'fake' if fake else 'gemini-2.0-flash-thinking-exp-01-21'
+        self.generation_config = {
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'max_output_tokens': 8000,
+        }
+        self._model = None
+        self.model_lock = threading.Lock()
+        self.fake = fake
+        # Every request goes through the client: rate limits, concurrency bound, timeouts, retries
+        self.client = GeminiClient(
+            lambda: self.model,
+            requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+            concurrency=GEMINI_CONCURRENCY,
+            timeout=GEMINI_TIMEOUT_SECONDS,
+            max_retries=GEMINI_MAX_RETRIES,
+            backoff=GEMINI_BACKOFF_SECONDS,
+            backoff_max=GEMINI_BACKOFF_MAX_SECONDS,
         )
+        # Ask for title and notes in one JSON response instead of two requests
+        self.single_call = single_call
+        # Stream the notes response into the file and the UI as it is generated
+        self.stream = stream
+        # Transcripts longer than chunk_tokens are summarised map-reduce style (0 disables)
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.chunk_concurrency = max(1, chunk_concurrency)
+        self.phase_stats = {name: StageStats(f"notes.{name}")
+                            for name in ("structured", "title", "single", "stream", "first_token",
+                                         "map", "reduce")}
+        self.response_cache = None
+        if use_cache and NOTES_CACHE_MAX_MB > 0:
+            self.response_cache = DiskCache(
+                NOTES_CACHE_DIR,
+                NOTES_CACHE_MAX_MB * 1024 * 1024,
+                ttl_seconds=NOTES_CACHE_TTL_DAYS * 86400 if NOTES_CACHE_TTL_DAYS > 0 else None,
+            )
+
+    @property
+    def model(self):
+        """The Gemini client, created on first use; importing google.generativeai
+        takes longer than the rest of startup put together"""
+        with self.model_lock:
+            if self._model is None and self.fake:
+                from fake_gemini import FakeModel
+                self._model = FakeModel()
+            if self._model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=GEMINI_API_KEY)
+                self._model = genai.GenerativeModel(
+                    model_name=self.model_name,
+                    generation_config=self.generation_config
+                )
+            return self._model
 
-    def generate_title(self, transcription):
+    def response_key(self, kind, content):
+        return cache_key(
+            model=self.model_name,
+            generation_config=self.generation_config,
+            prompt_version=PROMPT_VERSION,
+            kind=kind,
+            content=hashlib.blake2b(content.encode('utf-8'), digest_size=20).hexdigest(),
+        )
+
+    def generate_text(self, kind, content, prompt, metrics=None):
+        """Send a prompt to the model, memoised on model, generation config,
+        prompt version and a hash of the transcript content it was built from.
+        metrics (a metrics.FileMetrics) counts the tokens and cache hits."""
+        on_usage = metrics.llm_usage if metrics else None
+        if not self.response_cache:
+            return self.client.generate(prompt, on_usage)
+        key = self.response_key(kind, content)
+        text = self.response_cache.get(key)
+        if text is not None:
+            if metrics:
+                metrics.count('llm_cached')
+            return text
+        text = self.client.generate(prompt, on_usage)
+        if text:
+            try:
+                self.response_cache.put(key, text, kind=kind, model=self.model_name)
+            except OSError as e:
+                print(f"Warning: could not write notes cache entry: {e}", file=sys.stderr)
+        return text
+
+    def cache_stats(self):
+        return self.response_cache.stats() if self.response_cache else None
+
+    def client_stats(self):
+        """Requests attempted, retries, failures and time spent throttled or backing off"""
+        return self.client.stats()
+
+    def generate_title(self, transcription, metrics=None):
         try:
-            response = self.model.generate_content(
+            excerpt = transcription[:1000]
+            text = self.generate_text(
+                "title",
+                excerpt,
                 "Generate a short, descriptive title (max 30 chars, alphanumeric and hyphens only) for this content:\n" + 
-                transcription[:1000]
+                excerpt,
+                metrics
             )
-            # Clean and format the title
-            title = response.text.strip()
-            # Remove quotes, newlines and special characters, keep only alphanumeric and hyphens
-            title = re.sub(r'[^a-zA-Z0-9\-]', '', title)
-            # Ensure title isn't empty
-            return title if title else "untitled-notes"
+            return self.sanitize_title(text)
         except Exception as e:
-            print(f"Title generation error: {e}")
+            print(f"Title generation error: {e}", file=sys.stderr)
             return "untitled-notes"
 
+    def sanitize_title(self, text):
+        # Clean and format the title
+        title = text.strip()
+        # Remove quotes, newlines and special characters, keep only alphanumeric and hyphens
+        title = re.sub(r'[^a-zA-Z0-9\-]', '', title)
+        # Ensure title isn't empty
+        return title if title else "untitled-notes"
+
+    def structured_prompt(self, transcription):
+        return self.notes_prompt(transcription) + """
+            Respond with a single JSON object and nothing else, with exactly two string fields:
+            "title": a short, descriptive title (max 30 chars, alphanumeric and hyphens only)
+            "markdown": the complete notes document in Markdown
+            """
+
+    def parse_structured_response(self, text):
+        """Extract (title, markdown) from a JSON response, or None if it doesn't parse"""
+        text = re.sub(r'^```(?:json)?\s*', '', text.strip())
+        text = re.sub(r'\s*```$', '', text)
+        start, end = text.find('{'), text.rfind('}')
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        title, markdown = data.get('title'), data.get('markdown')
+        if not isinstance(title, str) or not isinstance(markdown, str) or not markdown.strip():
+            return None
+        return self.sanitize_title(title), markdown
+
+    def generate_title_and_notes(self, transcription, metrics=None):
+        """One request returning both title and notes; None if the reply isn't usable JSON"""
+        try:
+            text = self.generate_text("structured", transcription, self.structured_prompt(transcription), metrics)
+        except Exception as e:
+            print(f"Structured notes generation error: {e}", file=sys.stderr)
+            return None
+        return self.parse_structured_response(text or "")
+
     def clean_markdown_content(self, content):
         """Clean markdown content to prevent double markdown formatting"""
         # Remove outer markdown code fence if present
@@ -44,57 +231,198 @@ class NotesManager:
         content = content.strip('`')
         return content.strip()
 
-    def generate_notes(self, transcription, original_name):
-        try:
-            title = self.generate_title(transcription)
-            
-            prompt = f"""  
+    def notes_prompt(self, content):
+        return f"""  
 
-                *"Generate structured technical documentation in Markdown format from the provided course video transcript. Follow these guidelines:"*  
+            *"Generate structured technical documentation in Markdown format from the provided course video transcript. Follow these guidelines:"*  
 
-                #### **1. Remembering (Basic Recall)**  
-                - Start with a **summary** of the key topics covered.  
-                - Define important **terms, concepts, and formulas** clearly.  
+            #### **1. Remembering (Basic Recall)**  
+            - Start with a **summary** of the key topics covered.  
+            - Define important **terms, concepts, and formulas** clearly.  
 
-                #### **2. Understanding (Explain in Own Words)**  
-                - Break content into **sections** with clear, hierarchical **headings**.  
-                - Rephrase complex ideas in **simpler terms** without losing meaning.  
+            #### **2. Understanding (Explain in Own Words)**  
+            - Break content into **sections** with clear, hierarchical **headings**.  
+            - Rephrase complex ideas in **simpler terms** without losing meaning.  
 
-                #### **3. Applying (Use in Context)**  
-                - Provide **real-world examples** or use cases when applicable.  
-                - If the content is technical, include **code examples** in proper formatting.  
+            #### **3. Applying (Use in Context)**  
+            - Provide **real-world examples** or use cases when applicable.  
+            - If the content is technical, include **code examples** in proper formatting.  
 
-                #### **4. Analyzing (Break Down into Parts)**  
-                - Identify relationships between concepts using **diagrams, lists, or tables**.  
-                - Highlight **cause-and-effect relationships** within the topic.  
+            #### **4. Analyzing (Break Down into Parts)**  
+            - Identify relationships between concepts using **diagrams, lists, or tables**.  
+            - Highlight **cause-and-effect relationships** within the topic.  
 
-                #### **5. Evaluating (Critically Assess Information)**  
-                - Include potential **limitations, pros & cons, or different viewpoints**.  
-                - Add **common mistakes or misconceptions** learners should avoid.  
+            #### **5. Evaluating (Critically Assess Information)**  
+            - Include potential **limitations, pros & cons, or different viewpoints**.  
+            - Add **common mistakes or misconceptions** learners should avoid.  
 
-                #### **6. Creating (Synthesize New Ideas)**  
-                - Encourage deeper thinking by suggesting **further questions** for exploration.  
-                - Provide possible **next steps for application or advanced learning**.  
+            #### **6. Creating (Synthesize New Ideas)**  
+            - Encourage deeper thinking by suggesting **further questions** for exploration.  
+            - Provide possible **next steps for application or advanced learning**.  
 
-                
-                - Fix any transcription errors
-                - include code if technical
-                - mindmaps charts if possible or were a good option to visualize smth
-                ---
+            
+            - Fix any transcription errors
+            - include code if technical
+            - mindmaps charts if possible or were a good option to visualize smth
+            ---
+        Content:
+        {content}
+        """
+
+    def chunk_prompt(self, content, label):
+        return f"""
+            You are taking notes on one part of a longer course video transcript: {label}.
+            Write detailed Markdown notes for this part only. Keep every definition, formula,
+            example and code snippet, fix obvious transcription errors, and use headings for
+            the topics covered. Do not write an introduction or conclusion for the whole course.
+            ---
             Content:
-            {transcription}
+            {content}
             """
-            
-            response = self.model.generate_content(prompt)
-            if not response.text:
+
+    def merge_prompt(self, partial_notes):
+        return self.notes_prompt(
+            "The content below is a set of partial notes, in order, taken from consecutive parts "
+            "of one transcript. Merge them into a single document: remove repetition caused by "
+            "overlapping parts and keep every distinct detail.\n\n" + partial_notes
+        )
+
+    def timed(self, phase, func, *args, metrics=None):
+        """func(*args, metrics=metrics), timed as phase overall and in metrics"""
+        started = time.time()
+        ok = False
+        try:
+            value = func(*args, metrics=metrics)
+            ok = True
+            return value
+        finally:
+            stats = self.phase_stats[phase]
+            stats.record(started, time.time(), ok=ok)
+            if metrics:
+                metrics.timing(stats.name, time.time() - started)
+
+    def generate_chunked_notes(self, transcription, segments=None, metrics=None):
+        """Map-reduce notes: partial notes per overlapping window, generated
+        concurrently, then one pass merging them into the final document"""
+        windows = split_into_windows(
+            segments or segments_from_text(transcription), self.chunk_tokens, self.chunk_overlap_tokens)
+        if len(windows) == 1:
+            return self.timed("single", self.generate_text, "notes", transcription, self.notes_prompt(transcription),
+                              metrics=metrics)
+
+        def map_window(index, window):
+            label = window_label(window, index, len(windows))
+            text = self.timed("map", self.generate_text, "chunk-notes", label + window['text'],
+                              self.chunk_prompt(window['text'], label), metrics=metrics)
+            if not text:
+                raise ValueError(f"Empty response from model for {label}")
+            return f"## {label}\n\n{self.clean_markdown_content(text)}"
+
+        with ThreadPoolExecutor(max_workers=self.chunk_concurrency) as executor:
+            partials = list(executor.map(map_window, range(1, len(windows) + 1), windows))
+
+        partial_notes = "\n\n".join(partials)
+        return self.timed("reduce", self.generate_text, "merge-notes", partial_notes, self.merge_prompt(partial_notes),
+                          metrics=metrics)
+
+    def stream_notes(self, transcription, title, on_line=None, metrics=None):
+        """Stream the notes response into a temp file beside the final notes path,
+        renaming it into place once complete. Returns the notes path."""
+        notes_path = self.notes_path(title)
+        key = self.response_key("notes", transcription) if self.response_cache else None
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            chunks = [cached]
+            if metrics:
+                metrics.count('llm_cached')
+        else:
+            chunks = self.client.stream(self.notes_prompt(transcription), metrics.llm_usage if metrics else None)
+
+        cleaner = MarkdownStreamCleaner()
+        raw = []
+        started = time.time()
+        wrote_line = False
+        # Opened like any other output file, so it gets the usual umask permissions
+        # (mkstemp would leave the notes owner-only once renamed into place)
+        tmp_path = notes_path.parent / f".{title}.{os.getpid()}.{threading.get_ident()}.md.part"
+        try:
+            with open(tmp_path, 'x', encoding='utf-8') as f:
+                f.write(f"# {title}\n\n")
+
+                def write_lines(lines):
+                    nonlocal wrote_line
+                    for line in lines:
+                        f.write(("\n" if wrote_line else "") + line)
+                        wrote_line = True
+                        if on_line:
+                            on_line(line)
+                    f.flush()
+
+                for chunk in chunks:
+                    if not raw:
+                        self.phase_stats["first_token"].record(started, time.time())
+                        if metrics:
+                            metrics.timing("notes.first_token", time.time() - started)
+                    raw.append(chunk)
+                    write_lines(cleaner.feed(chunk))
+                write_lines(cleaner.finish())
+
+            if not wrote_line:
+                raise ValueError("Empty response from model")
+            os.replace(tmp_path, notes_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if key and cached is None:
+            try:
+                self.response_cache.put(key, "".join(raw), kind="notes", model=self.model_name)
+            except OSError as e:
+                print(f"Warning: could not write notes cache entry: {e}", file=sys.stderr)
+        return str(notes_path)
+
+    def notes_path(self, title):
+        # Create sanitized path
+        notes_path = Path(NOTES_OUTPUT_DIR).resolve() / f"{title}.md"
+        notes_path.parent.mkdir(parents=True, exist_ok=True)
+        return notes_path
+
+    def get_phase_stats(self):
+        return [stats.snapshot() for stats in self.phase_stats.values() if stats.items]
+
+    def generate_notes(self, transcription, original_name, segments=None, on_line=None, metrics=None):
+        """Generate and write notes, returning their path.
+
+        In streaming mode on_line(line) receives each cleaned line as it arrives.
+        metrics (a metrics.FileMetrics) collects the file's LLM timings and tokens."""
+        try:
+            title, text = None, None
+            if self.chunk_tokens and estimate_tokens(transcription) > self.chunk_tokens:
+                title = self.timed("title", self.generate_title, transcription, metrics=metrics)
+                text = self.generate_chunked_notes(transcription, segments, metrics)
+            elif self.stream:
+                title = self.timed("title", self.generate_title, transcription, metrics=metrics)
+                return self.timed("stream", self.stream_notes, transcription, title, on_line, metrics=metrics)
+            elif self.single_call:
+                structured = self.timed("structured", self.generate_title_and_notes, transcription, metrics=metrics)
+                if structured:
+                    title, text = structured
+                else:
+                    print("Structured response could not be parsed, falling back to separate title and notes requests",
+                          file=sys.stderr)
+
+            if text is None:
+                title = self.timed("title", self.generate_title, transcription, metrics=metrics)
+                text = self.timed("single", self.generate_text, "notes", transcription,
+                                  self.notes_prompt(transcription), metrics=metrics)
+            if not text:
                 raise ValueError("Empty response from model")
             
             # Clean the markdown content
-            cleaned_content = self.clean_markdown_content(response.text)
+            cleaned_content = self.clean_markdown_content(text)
             
-            # Create sanitized path
-            notes_path = Path(NOTES_OUTPUT_DIR).resolve() / f"{title}.md"
-            notes_path.parent.mkdir(parents=True, exist_ok=True)
+            notes_path = self.notes_path(title)
             
             # Write content with error handling
             try:
@@ -102,9 +430,9 @@ class NotesManager:
                     f.write(f"# {title}\n\n{cleaned_content}")
                 return str(notes_path)
             except OSError as e:
-                print(f"Failed to write file: {e}")
+                print(f"Failed to write file: {e}", file=sys.stderr)
                 raise
                 
         except Exception as e:
-            print(f"Notes generation error: {e}")
+            print(f"Notes generation error: {e}", file=sys.stderr)
             raise Exception(f"Failed to generate notes: {str(e)}")
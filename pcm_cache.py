@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+from disk_cache import DiskCache
+from transcript_cache import file_digest
+
+__all__ = ['PcmCache']
+
+
+class PcmCache(DiskCache):
+    """Decoded 16 kHz mono PCM per media file, stored as .npy and keyed on content.
+
+    Whisper would otherwise run ffmpeg over the whole container (mostly video
+    bytes) on every transcription; with this cache a file is decoded once and
+    later runs, including with a different model, memory-map the samples."""
+    SUFFIX = '.npy'
+
+    def path_of(self, file_path):
+        """Where file_path's PCM is, or will be once extracted"""
+        return self.path_for(file_digest(file_path))
+
+    def extract(self, file_path, keep=None):
+        """Path of the .npy holding file_path's PCM, decoding it on a miss.
+        Making room for it never evicts the paths keep() returns, asked only
+        once it is decoded so files other threads decoded meanwhile count."""
+        path = self.path_of(file_path)
+        if path.exists():
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.count(True)
+            return path
+
+        self.count(False)
+        # Imported here so numpy stays out of app startup
+        import numpy as np
+        from long_media import decode_audio
+
+        audio = decode_audio(file_path)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npy.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, audio)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep={path, *(keep() if keep else ())})
+        return path
+
+    def load(self, path):
+        """Memory-map cached PCM read-only; pages are shared with the OS cache"""
+        import numpy as np
+        return np.load(path, mmap_mode='r')
+
+    def read_meta(self, path):
+        return {}
@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+__all__ = ['current_file', 'set_current_file', 'StageStats', 'NotesStage', 'WriteStage', 'FileCompletion',
+           'AudioPrefetcher']
+
+# The file each thread is working on, so UI updates from a stage's thread can
+# be told apart from those of the file transcribing meanwhile
+_context = threading.local()
+
+
+def current_file():
+    return getattr(_context, 'file_path', None)
+
+
+def set_current_file(file_path):
+    _context.file_path = file_path
+
+
+class StageStats:
+    """Thread-safe throughput counters for one pipeline stage. With metrics (a
+    metrics.PipelineMetrics), timings recorded for a file also go to its record."""
+    def __init__(self, name, metrics=None):
+        self.name = name
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.first_started = None
+        self.last_finished = None
+
+    def record(self, started, finished, ok=True, file_path=None):
+        if self.metrics and file_path:
+            self.metrics.timing(file_path, self.name, finished - started)
+        with self.lock:
+            self.items += 1
+            if not ok:
+                self.errors += 1
+            self.busy_seconds += finished - started
+            if self.first_started is None or started < self.first_started:
+                self.first_started = started
+            self.last_finished = finished
+
+    def snapshot(self):
+        with self.lock:
+            wall = (self.last_finished - self.first_started) if self.items else 0.0
+            return {
+                'stage': self.name,
+                'items': self.items,
+                'errors': self.errors,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'wall_seconds': round(wall, 3),
+                'items_per_minute': round(self.items * 60 / wall, 2) if wall > 0 else None,
+            }
+
+
+class NotesStage:
+    """Notes generation stage fed by the transcription stage.
+
+    A bounded queue sits between the two: submit() blocks once `queue_size`
+    transcripts are waiting, so a fast transcriber can't pile up unbounded work,
+    while up to `concurrency` threads wait on the LLM in parallel.
+    on_result(file_path, notes_path, error) hears how each file went."""
+    def __init__(self, ui, notes_manager, concurrency=2, queue_size=4, output=None, on_result=None, metrics=None):
+        self.ui = ui
+        self.notes_manager = notes_manager
+        # Receives streamed notes lines for the progress terminal
+        self.output = output
+        self.on_result = on_result
+        self.concurrency = max(1, concurrency)
+        self.jobs = Queue(maxsize=max(1, queue_size))
+        self.metrics = metrics
+        self.stats = StageStats("notes", metrics)
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self.worker, name=f"notes-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, file_path, transcript, on_done=None):
+        """Queue notes for a transcript (a SegmentStore)"""
+        self.start()
+        if self.metrics:
+            self.metrics.file(file_path).gauge('notes_queue_depth', self.jobs.qsize())
+        self.jobs.put((file_path, transcript, on_done, time.time()))
+
+    def join(self):
+        """Block until every submitted transcript has its notes (or an error)"""
+        self.jobs.join()
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            file_path, transcript, on_done, queued = job
+            set_current_file(file_path)
+            if self.metrics:
+                self.metrics.timing(file_path, "notes_wait", time.time() - queued)
+            ok = self.generate(file_path, transcript)
+            if on_done:
+                on_done(file_path, ok)
+            set_current_file(None)
+            self.jobs.task_done()
+
+    def generate(self, file_path, transcript):
+        base_name = os.path.basename(file_path)
+        self.ui.update_status(f"Generating notes for: {base_name}")
+        self.ui.update_notes_state("processing")
+        started = time.time()
+        try:
+            base_name_without_ext = os.path.splitext(base_name)[0]
+            notes_path = self.notes_manager.generate_notes(
+                transcript.text, base_name_without_ext, segments=list(transcript), on_line=self.output,
+                metrics=self.metrics.file(file_path) if self.metrics else None)
+        except Exception as e:
+            self.stats.record(started, time.time(), ok=False, file_path=file_path)
+            if self.on_result:
+                self.on_result(file_path, None, e)
+            self.ui.update_notes_state("error")
+            self.ui.update_status(f"Error generating notes for {base_name}: {str(e)}")
+            self.ui.update_output(f"Error: {str(e)}")
+            return False
+        self.stats.record(started, time.time(), file_path=file_path)
+        if self.on_result:
+            self.on_result(file_path, notes_path, None)
+        self.ui.update_notes_state("completed")
+        self.ui.update_status(f"Completed: {base_name}\nNotes saved to: {notes_path}")
+        return True
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+
+class WriteStage:
+    """Transcript file writes, on one background I/O thread.
+
+    The transcribing thread hands its finished transcript over and moves on to
+    the next file instead of waiting on the disk. Jobs run in the order they
+    were submitted, so segments streamed to a .part file always land before
+    that file is committed. The queue is bounded: a disk that can't keep up
+    eventually pauses transcription rather than buffering without limit."""
+    def __init__(self, queue_size=1024, metrics=None):
+        self.jobs = Queue(maxsize=max(1, queue_size))
+        self.metrics = metrics
+        self.stats = StageStats("write", metrics)
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker, name="transcript-writer", daemon=True)
+            self.thread.start()
+
+    def submit(self, write, on_done=None, file_path=None):
+        """Queue write(); on_done(error) follows with None on success.
+        file_path names the file it writes for, for its metrics."""
+        self.start()
+        if self.metrics and file_path:
+            self.metrics.file(file_path).gauge('write_queue_depth', self.jobs.qsize())
+        self.jobs.put((write, (), on_done, True, file_path))
+
+    def stream(self, write, *args):
+        """Queue a small ordered write such as one streamed segment. Failures
+        are ignored: the final transcript is written in full when they happen."""
+        self.start()
+        self.jobs.put((write, args, None, False, None))
+
+    def join(self):
+        self.jobs.join()
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            write, args, on_done, counted, file_path = job
+            set_current_file(file_path)
+            started = time.time()
+            error = None
+            try:
+                write(*args)
+            except Exception as e:
+                error = e
+            if counted:
+                self.stats.record(started, time.time(), ok=error is None, file_path=file_path)
+            if on_done:
+                on_done(error)
+            set_current_file(None)
+            self.jobs.task_done()
+
+    def shutdown(self):
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+class FileCompletion:
+    """Calls on_done(file_path, ok) once every stage handling a file has
+    finished it, with ok only if all of them succeeded"""
+    def __init__(self, file_path, on_done, stages):
+        self.file_path = file_path
+        self.on_done = on_done
+        self.remaining = stages
+        self.ok = True
+        self.lock = threading.Lock()
+
+    def __call__(self, file_path, ok):
+        with self.lock:
+            self.ok = self.ok and ok
+            self.remaining -= 1
+            if self.remaining:
+                return
+        if self.on_done:
+            self.on_done(self.file_path, self.ok)
+
+
+class AudioPrefetcher:
+    """Decode stage in front of the transcriber.
+
+    Upcoming files are extracted to the PCM cache on a small thread pool while
+    the current one transcribes. At most `lookahead` files are decoded ahead
+    of the transcriber, which bounds the disk space the stage can claim.
+    skip(path) lets callers avoid decoding files that won't need audio, such
+    as ones already in the transcription cache."""
+    def __init__(self, pcm_cache, workers=2, lookahead=4, skip=None, metrics=None):
+        self.pcm_cache = pcm_cache
+        self.lookahead = max(1, lookahead)
+        self.skip = skip
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.waiting = deque()
+        self.futures = {}
+        # PCM decoded (or decoding) for files not transcribed yet, kept safe from eviction
+        self.decoded = {}
+        self.stats = StageStats("decode", metrics)
+
+    def prefetch(self, files):
+        with self.lock:
+            self.waiting.extend(files)
+            self.fill()
+
+    def fill(self):
+        while self.waiting and len(self.futures) < self.lookahead:
+            file_path = self.waiting.popleft()
+            if file_path not in self.futures:
+                self.futures[file_path] = self.executor.submit(self.extract, file_path, True)
+
+    def extract(self, file_path, speculative=False):
+        if speculative and self.skip and self.skip(file_path):
+            return None
+        started = time.time()
+        try:
+            # Claimed before decoding, so no other file's eviction takes it meanwhile
+            path = self.pcm_cache.path_of(file_path)
+            with self.lock:
+                self.decoded[file_path] = path
+            path = self.pcm_cache.extract(file_path, keep=self.decoded_paths)
+        except Exception:
+            with self.lock:
+                self.decoded.pop(file_path, None)
+            self.stats.record(started, time.time(), ok=False, file_path=file_path)
+            raise
+        self.stats.record(started, time.time(), file_path=file_path)
+        return path
+
+    def decoded_paths(self):
+        with self.lock:
+            return set(self.decoded.values())
+
+    def get(self, file_path):
+        """Path of the decoded PCM for file_path, waiting for its prefetch or
+        decoding it now if it was never queued"""
+        with self.lock:
+            future = self.futures.pop(file_path, None)
+            if future is None:
+                try:
+                    self.waiting.remove(file_path)
+                except ValueError:
+                    pass
+                future = self.executor.submit(self.extract, file_path)
+            self.fill()
+        path = future.result()
+        return path if path is not None else self.extract(file_path)
+
+    def release(self, file_path):
+        """Forget file_path once it has been transcribed, e.g. from the cache
+        without ever asking for its audio, so its lookahead slot frees up"""
+        with self.lock:
+            future = self.futures.pop(file_path, None)
+            if future is not None:
+                future.cancel()
+            self.decoded.pop(file_path, None)
+            self.fill()
@@ -0,0 +1,149 @@
+import re
+import sys
+import threading
+import time
+
+__all__ = ['ProgressTracker', 'capture_segments', 'format_segment_line', 'media_duration']
+
+
+def media_duration(audio, file_path):
+    """Length in seconds of decoded samples, or of file_path via ffprobe when
+    the engine was given a path; None if unknown"""
+    if isinstance(audio, str):
+        from scheduler import probe_duration
+        return probe_duration(file_path)
+    from long_media import SAMPLE_RATE
+    return len(audio) / SAMPLE_RATE
+
+
+def _clock(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    if hours:
+        return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+    return f"{minutes:02d}:{seconds:06.3f}"
+
+
+def format_segment_line(segment):
+    """One progress-terminal line per segment, in whisper's verbose style"""
+    return f"[{_clock(segment['start'])} --> {_clock(segment['end'])}] {segment['text'].strip()}"
+
+
+class ProgressTracker:
+    """Percent complete and ETA for one file, from how much of its media has
+    been transcribed so far.
+
+    Chunks of a split file transcribe in parallel, so progress is tracked per
+    lane (one per chunk, each counting from the chunk's own start) and summed."""
+    def __init__(self, duration, started=None):
+        self.duration = duration
+        self.started = started if started is not None else time.time()
+        self.done = {}
+
+    def advance(self, seconds, lane=0):
+        self.done[lane] = max(self.done.get(lane, 0.0), seconds)
+
+    def percent(self):
+        if not self.duration:
+            return None
+        return round(min(100.0, 100.0 * sum(self.done.values()) / self.duration), 1)
+
+    def eta(self):
+        """Seconds left at the rate so far, or None until there is a rate"""
+        percent = self.percent()
+        if not percent:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed * (100.0 - percent) / percent, 1)
+
+
+# whisper has no segment callback: it only reports segments by printing
+# "[MM:SS.mmm --> MM:SS.mmm] text" in verbose mode. capture_segments() parses
+# those lines, for the calling thread only, so sys.stdout is never swapped
+# out from under other threads.
+SEGMENT_LINE = re.compile(r'^\[((?:\d+:)?\d+:\d+\.\d+) --> ((?:\d+:)?\d+:\d+\.\d+)\] ?(.*)$')
+
+
+def _seconds(clock):
+    seconds = 0.0
+    for part in clock.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class _ThreadRouter:
+    """sys.stdout wrapper sending each thread's writes to its registered sink,
+    or to the wrapped stream for threads without one"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        sink = getattr(self.local, 'sink', None)
+        if sink is None:
+            return self.stream.write(text)
+        sink.write(text)
+        return len(text)
+
+    def flush(self):
+        sink = getattr(self.local, 'sink', None)
+        if sink is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_router_lock = threading.Lock()
+
+
+class _SegmentSink:
+    def __init__(self, on_segment, stream, on_line=None):
+        self.on_segment = on_segment
+        self.stream = stream
+        self.on_line = on_line
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self.line(line)
+
+    def line(self, line):
+        match = SEGMENT_LINE.match(line)
+        if match:
+            start, end, text = match.groups()
+            self.on_segment({'start': _seconds(start), 'end': _seconds(end), 'text': text})
+        elif line.strip():
+            # Anything else (language detection, warnings) goes to on_line, or
+            # still reaches the console
+            if self.on_line:
+                self.on_line(line)
+            else:
+                self.stream.write(line + '\n')
+
+
+class capture_segments:
+    """Context manager delivering whisper's verbose segment lines printed by
+    this thread to on_segment as {'start', 'end', 'text'} dicts, and any other
+    lines to on_line (the real stdout by default)"""
+    def __init__(self, on_segment, on_line=None):
+        self.on_segment = on_segment
+        self.on_line = on_line
+
+    def __enter__(self):
+        with _router_lock:
+            if not isinstance(sys.stdout, _ThreadRouter):
+                sys.stdout = _ThreadRouter(sys.stdout)
+            self.router = sys.stdout
+        self.previous = getattr(self.router.local, 'sink', None)
+        self.sink = _SegmentSink(self.on_segment, self.router.stream, self.on_line)
+        self.router.local.sink = self.sink
+        return self
+
+    def __exit__(self, *exc):
+        if self.sink.buffer:
+            self.sink.line(self.sink.buffer)
+        self.router.local.sink = self.previous
+        return False
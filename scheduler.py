@@ -0,0 +1,447 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from backends import model_key
+from metrics import peak_rss_mb
+from progress import ProgressTracker
+
+__all__ = ['probe_duration', 'order_longest_first', 'TranscriptionScheduler']
+
+
+def probe_duration(file_path):
+    """Return the media duration in seconds using ffprobe, or None if unavailable"""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", file_path],
+            capture_output=True, text=True, timeout=30,
+        ).stdout.strip()
+        return float(output)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def order_longest_first(files, durations=None):
+    """Sort files by decreasing duration so the longest jobs start first.
+
+    Falls back to file size when any duration can't be probed, since mixing the
+    two units would give a meaningless order."""
+    if durations is None:
+        durations = {path: probe_duration(path) for path in files}
+    if all(d is not None for d in durations.values()):
+        return sorted(files, key=lambda path: durations[path], reverse=True)
+    return sorted(files, key=lambda path: os.path.getsize(path) if os.path.exists(path) else 0, reverse=True)
+
+
+class _QueueWriter:
+    """stdout replacement inside a worker: forwards whole lines to the parent"""
+    def __init__(self, messages, worker_id):
+        self.messages = messages
+        self.worker_id = worker_id
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        if '\n' in self.buffer:
+            lines = self.buffer.split('\n')
+            for line in lines[:-1]:
+                if line.strip():
+                    self.messages.put(("output", self.worker_id, line))
+            self.buffer = lines[-1]
+
+    def flush(self):
+        if self.buffer.strip():
+            self.messages.put(("output", self.worker_id, self.buffer))
+        self.buffer = ""
+
+
+def _worker_main(worker_id, backend, model_name, pool_size, pool_max_bytes, options, cache_dir, cache_max_bytes,
+                 pcm_cache_dir, pcm_cache_max_bytes, tasks, messages, claims):
+    from model_pool import ModelPool
+    from transcript_cache import TranscriptCache
+
+    models = ModelPool(backend, pool_size, pool_max_bytes)
+    models.get(model_name)
+    cache = TranscriptCache(cache_dir, cache_max_bytes) if cache_dir else None
+    pcm_cache = None
+    if pcm_cache_dir:
+        from pcm_cache import PcmCache
+        pcm_cache = PcmCache(pcm_cache_dir, pcm_cache_max_bytes)
+
+    def transcribe(file_path, model_name, on_segment, timings):
+        audio = file_path
+        if pcm_cache:
+            started = time.time()
+            audio = pcm_cache.load(pcm_cache.extract(file_path))
+            timings['decode_seconds'] = time.time() - started
+        return models.get(model_name).transcribe(audio, on_segment=on_segment, **options)
+
+    messages.put(("ready", worker_id))
+    sys.stdout = _QueueWriter(messages, worker_id)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, file_path, model_name, claim = task
+        # Lets the parent fail this task should the worker die before reporting it started
+        claims[worker_id] = claim
+        messages.put(("started", worker_id, task_id))
+        timings = {}
+
+        def on_segment(segment, task_id=task_id):
+            messages.put(("segment", worker_id, task_id,
+                          {'start': segment['start'], 'end': segment['end'], 'text': segment['text']}))
+
+        try:
+            if file_path.endswith('.npy'):
+                # Pre-decoded chunk of a long file; the parent caches the stitched result
+                import numpy as np
+                result = models.get(model_name).transcribe(np.load(file_path), on_segment=on_segment, **options)
+            elif cache:
+                result, hit = cache.fetch_or_transcribe(
+                    file_path, model_key(backend, model_name), options,
+                    lambda: transcribe(file_path, model_name, on_segment, timings))
+                if hit:
+                    timings['cached'] = True
+                    print(f"Loaded cached transcription for {os.path.basename(file_path)}")
+            else:
+                result = transcribe(file_path, model_name, on_segment, timings)
+            sys.stdout.flush()
+            messages.put(("result", worker_id, task_id, {
+                'text': result['text'],
+                'segments': result.get('segments', []),
+                'language': result.get('language', 'unknown'),
+                # For the parent's per-file metrics
+                'worker_peak_rss_mb': peak_rss_mb(),
+                **timings,
+            }))
+        except Exception as e:
+            sys.stdout.flush()
+            messages.put(("error", worker_id, task_id, str(e)))
+
+
+class _Batch:
+    """Bookkeeping for one run(): maps worker tasks back to files and
+    collects chunk results until a long file can be stitched"""
+    def __init__(self, on_start, on_result, on_error, on_segment=None, durations=None):
+        self.on_start = on_start
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_segment = on_segment
+        self.durations = durations or {}
+        self.trackers = {}
+        self.tasks = {}
+        self.outstanding = set()
+        self.started_files = set()
+        self.long_files = {}
+
+    def add_task(self, task_id, file_path, chunk_index=None):
+        self.tasks[task_id] = (file_path, chunk_index)
+        self.outstanding.add(task_id)
+
+    def add_long_file(self, file_path, chunks, chunk_dir):
+        self.long_files[file_path] = {
+            'results': [None] * len(chunks),
+            'offsets': [offset for _, offset in chunks],
+            'remaining': len(chunks),
+            'failed': False,
+            'dir': chunk_dir,
+        }
+
+    def started(self, task_id):
+        if task_id not in self.tasks:
+            return
+        file_path = self.tasks[task_id][0]
+        if file_path not in self.started_files:
+            self.started_files.add(file_path)
+            self.trackers[file_path] = ProgressTracker(self.durations.get(file_path))
+            if self.on_start:
+                self.on_start(file_path)
+
+    def segment(self, task_id, segment):
+        """Report a segment with file-relative timestamps; each chunk of a long
+        file advances its own lane of the file's progress"""
+        if task_id not in self.outstanding:
+            return
+        file_path, chunk_index = self.tasks[task_id]
+        tracker = self.trackers[file_path]
+        if chunk_index is None:
+            tracker.advance(segment['end'])
+        else:
+            tracker.advance(segment['end'], lane=chunk_index)
+            offset = self.long_files[file_path]['offsets'][chunk_index]
+            segment = dict(segment, start=segment['start'] + offset, end=segment['end'] + offset)
+        if self.on_segment:
+            self.on_segment(file_path, segment, tracker)
+
+    def result(self, task_id, result):
+        """Record a task result; returns (file_path, stitched_result) when it completes a long file"""
+        if task_id not in self.outstanding:
+            return None
+        self.outstanding.discard(task_id)
+        file_path, chunk_index = self.tasks[task_id]
+        if chunk_index is None:
+            if self.on_result:
+                self.on_result(file_path, result)
+            return None
+
+        job = self.long_files[file_path]
+        job['results'][chunk_index] = result
+        if not self.chunk_done(file_path) or job['failed']:
+            return None
+        from long_media import stitch_results
+        stitched = stitch_results(job['results'], job['offsets'])
+        if self.on_result:
+            self.on_result(file_path, stitched)
+        return file_path, stitched
+
+    def error(self, task_id, message):
+        if task_id not in self.outstanding:
+            return
+        self.outstanding.discard(task_id)
+        file_path, chunk_index = self.tasks[task_id]
+        if chunk_index is not None:
+            job = self.long_files[file_path]
+            self.chunk_done(file_path)
+            if job['failed']:
+                return
+            job['failed'] = True
+        if self.on_error:
+            self.on_error(file_path, message)
+
+    def chunk_done(self, file_path):
+        """Count a finished chunk; removes the chunk files once none remain"""
+        job = self.long_files[file_path]
+        job['remaining'] -= 1
+        if job['remaining'] == 0:
+            shutil.rmtree(job['dir'], ignore_errors=True)
+            return True
+        return False
+
+
+class TranscriptionScheduler:
+    """Pool of worker processes, each keeping its recently used models resident.
+
+    Files are queued longest-first and pulled by whichever worker is idle, so
+    long recordings don't end up as a tail at the end of the batch; the very
+    longest are split into chunks (see long_media). Workers stay alive between
+    batches until shutdown() is called."""
+    def __init__(self, model_name, workers, transcribe_options=None, cache_dir=None, cache_max_bytes=0,
+                 long_media_seconds=0, chunk_seconds=300, pcm_cache_dir=None, pcm_cache_max_bytes=0,
+                 backend="whisper", model_pool_size=1, model_pool_max_bytes=0):
+        self.backend = backend
+        self.model_name = model_name
+        self.model_pool_size = model_pool_size
+        self.model_pool_max_bytes = model_pool_max_bytes
+        self.pcm_cache_dir = str(pcm_cache_dir) if pcm_cache_dir else None
+        self.pcm_cache_max_bytes = pcm_cache_max_bytes
+        self.long_media_seconds = long_media_seconds
+        self.chunk_seconds = chunk_seconds
+        self.workers = max(1, workers)
+        self.options = transcribe_options if transcribe_options is not None else {'verbose': True}
+        self.cache_dir = str(cache_dir) if cache_dir else None
+        self.cache_max_bytes = cache_max_bytes
+        self.ctx = multiprocessing.get_context("spawn")
+        self.tasks = self.ctx.Queue()
+        self.messages = self.ctx.Queue()
+        # The claim number of the task each worker last took off the queue
+        self.claims = self.ctx.Array('q', [-1] * self.workers, lock=False)
+        self.claim_numbers = itertools.count()
+        self.claimed = {}
+        self.processes = {}
+        self.ready = set()
+
+    def start(self):
+        for worker_id in range(self.workers):
+            if worker_id not in self.processes:
+                self._spawn(worker_id)
+
+    def _spawn(self, worker_id):
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.backend, self.model_name, self.model_pool_size, self.model_pool_max_bytes,
+                  self.options, self.cache_dir, self.cache_max_bytes, self.pcm_cache_dir,
+                  self.pcm_cache_max_bytes, self.tasks, self.messages, self.claims),
+            daemon=True,
+        )
+        self.claims[worker_id] = -1
+        process.start()
+        self.processes[worker_id] = process
+
+    def _put_task(self, task_id, file_path, model_name):
+        claim = next(self.claim_numbers)
+        self.claimed[claim] = task_id
+        self.tasks.put((task_id, file_path, model_name, claim))
+
+    def run(self, files, on_start=None, on_result=None, on_error=None, on_output=None, models=None,
+            on_segment=None):
+        """Transcribe files on the pool, invoking the callbacks from the calling thread.
+
+        Files at least long_media_seconds long are decoded once in the parent,
+        split at silences and transcribed as chunks spread across all workers,
+        then stitched back into one result. Blocks until every file has
+        produced either a result or an error. models maps files to a model
+        other than model_name; workers load it alongside their current one.
+        on_segment(file_path, segment, tracker) receives segments as workers
+        decode them, with the file's ProgressTracker."""
+        models = {f: (models or {}).get(f, self.model_name) for f in files}
+        self.start()
+        durations = {path: probe_duration(path) for path in files}
+        batch = _Batch(on_start, on_result, on_error, on_segment, durations)
+        self.claimed.clear()
+        long_files = [path for path in files
+                      if self.long_media_seconds and (durations[path] or 0) >= self.long_media_seconds]
+        for file_path in order_longest_first([f for f in files if f not in long_files], durations):
+            batch.add_task(file_path, file_path)
+            self._put_task(file_path, file_path, models[file_path])
+
+        prepared = queue.Queue()
+        if long_files:
+            threading.Thread(target=self._prepare_long_files, args=(long_files, models, prepared, on_output),
+                             daemon=True).start()
+        preparing = len(long_files)
+
+        in_flight = {}
+        while batch.outstanding or preparing:
+            while preparing:
+                try:
+                    file_path, chunks, value = prepared.get_nowait()
+                except queue.Empty:
+                    break
+                preparing -= 1
+                self._enqueue_long_file(batch, file_path, models[file_path], chunks, value)
+
+            try:
+                message = self.messages.get(timeout=0.2 if preparing else 1)
+            except queue.Empty:
+                self._reap(in_flight, batch)
+                continue
+
+            kind, worker_id = message[0], message[1]
+            if kind == "ready":
+                self.ready.add(worker_id)
+            elif kind == "output":
+                if on_output:
+                    on_output(message[2])
+            elif kind == "started":
+                in_flight[worker_id] = message[2]
+                batch.started(message[2])
+            elif kind == "segment":
+                batch.segment(message[2], message[3])
+            elif kind == "result":
+                in_flight.pop(worker_id, None)
+                stitched = batch.result(message[2], message[3])
+                if stitched:
+                    self._cache_long_result(*stitched, models[stitched[0]])
+            elif kind == "error":
+                in_flight.pop(worker_id, None)
+                batch.error(message[2], message[3])
+
+    def _prepare_long_files(self, files, models, prepared, on_output):
+        """Decode and split long files in the background while workers start on the rest"""
+        from long_media import decode_audio, find_split_points, write_chunks
+
+        cache = self._parent_cache()
+        for file_path in files:
+            try:
+                if cache:
+                    result = cache.get(cache.key(file_path, model_key(self.backend, models[file_path]),
+                                                 self.options))
+                    if result is not None:
+                        prepared.put((file_path, None, result))
+                        continue
+                if self.pcm_cache_dir:
+                    from pcm_cache import PcmCache
+                    pcm_cache = PcmCache(self.pcm_cache_dir, self.pcm_cache_max_bytes)
+                    audio = pcm_cache.load(pcm_cache.extract(file_path))
+                else:
+                    audio = decode_audio(file_path)
+                ranges = find_split_points(audio, self.chunk_seconds)
+                chunk_dir = tempfile.mkdtemp(prefix="noter-chunks-")
+                chunks = write_chunks(audio, ranges, chunk_dir)
+                del audio
+                if on_output:
+                    on_output(f"Split {os.path.basename(file_path)} into {len(chunks)} chunks")
+                prepared.put((file_path, chunks, chunk_dir))
+            except Exception as e:
+                prepared.put((file_path, None, e))
+
+    def _enqueue_long_file(self, batch, file_path, model_name, chunks, value):
+        if chunks is None:
+            # Either a cached result or the exception raised while preparing
+            batch.add_task(file_path, file_path)
+            batch.started(file_path)
+            if isinstance(value, Exception):
+                batch.error(file_path, str(value))
+            else:
+                batch.result(file_path, value)
+            return
+        batch.add_long_file(file_path, chunks, value)
+        for i, (chunk_path, _) in enumerate(chunks):
+            task_id = f"{file_path}#chunk{i}"
+            batch.add_task(task_id, file_path, i)
+            self._put_task(task_id, chunk_path, model_name)
+
+    def _parent_cache(self):
+        if not self.cache_dir:
+            return None
+        from transcript_cache import TranscriptCache
+        return TranscriptCache(self.cache_dir, self.cache_max_bytes)
+
+    def _cache_long_result(self, file_path, result, model_name):
+        cache = self._parent_cache()
+        if not cache:
+            return
+        cache_model = model_key(self.backend, model_name)
+        try:
+            cache.put(cache.key(file_path, cache_model, self.options), result,
+                      source=os.path.abspath(file_path), model=cache_model)
+        except OSError as e:
+            print(f"Warning: could not write transcription cache entry: {e}", file=sys.stderr)
+
+    def _reap(self, in_flight, batch):
+        """Fail the task a crashed worker was holding and replace the worker"""
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            del self.processes[worker_id]
+            task_id = in_flight.pop(worker_id, None)
+            if task_id is None:
+                # Died before reporting its task started; batch.error ignores
+                # it if the task had already finished
+                task_id = self.claimed.get(self.claims[worker_id])
+            if task_id is not None:
+                batch.error(task_id, f"worker exited with code {process.exitcode}")
+            if worker_id in self.ready:
+                self._spawn(worker_id)
+
+        if not self.processes:
+            # Every worker failed to even load the model; nothing will drain the queue
+            while True:
+                try:
+                    task = self.tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is not None:
+                    batch.error(task[0], f"could not start a worker with the {self.model_name} model")
+
+    def shutdown(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes.clear()
+        self.ready.clear()
@@ -0,0 +1,350 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from segments import SegmentStore
+from utils import MEDIA_EXTENSIONS
+
+__all__ = ['TRANSCRIPT_FORMATS', 'match_query', 'read_transcript', 'read_notes', 'SearchIndex']
+
+# Transcript formats the index can read, richest first: of several transcripts
+# of one recording, only the first of these is indexed
+TRANSCRIPT_FORMATS = ["json", "jsonl", "srt", "vtt", "txt"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT,
+    title TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    indexed REAL
+);
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY,
+    document INTEGER NOT NULL,
+    start_seconds REAL,
+    end_seconds REAL,
+    heading TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_document ON passages (document);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5 (
+    text, heading, content='passages', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN
+    INSERT INTO passages_fts (rowid, text, heading) VALUES (new.id, new.text, new.heading);
+END;
+CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN
+    INSERT INTO passages_fts (passages_fts, rowid, text, heading) VALUES ('delete', old.id, old.text, old.heading);
+END;
+"""
+
+TIMESTAMP = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{3})')
+HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+
+
+def match_query(text):
+    """An FTS5 query matching passages that contain every word of text, so
+    user input can't trip over FTS5 syntax; a trailing * keeps prefix search"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    if not terms:
+        raise ValueError("Empty search query")
+    return " ".join(terms)
+
+
+def _seconds(match):
+    hours, minutes, seconds, milliseconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+
+
+def read_transcript(path):
+    """A SegmentStore from a transcript file in one of TRANSCRIPT_FORMATS, or
+    None if it doesn't look like one of ours"""
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in TRANSCRIPT_FORMATS:
+        return None
+    store = SegmentStore()
+    with open(path, encoding='utf-8') as f:
+        if fmt == "json":
+            try:
+                data = json.load(f)
+            except ValueError:
+                return None
+            if not isinstance(data, dict) or not isinstance(data.get('segments'), list):
+                return None
+            store.language = data.get('language', 'unknown')
+            for segment in data['segments']:
+                store.append(segment['start'], segment['end'], segment['text'])
+        elif fmt == "jsonl":
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    segment = json.loads(line)
+                    store.append(segment['start'], segment['end'], segment['text'])
+                except (ValueError, KeyError, TypeError):
+                    return None
+        elif fmt in ("srt", "vtt"):
+            # Blocks of an optional index, a "start --> end" line and the text
+            for block in re.split(r'\n\s*\n', f.read()):
+                lines = block.strip().splitlines()
+                for i, line in enumerate(lines):
+                    if '-->' in line:
+                        start, end = (TIMESTAMP.search(part) for part in line.split('-->', 1))
+                        if start and end:
+                            text = " ".join(lines[i + 1:]).strip()
+                            if text:
+                                store.append(_seconds(start), _seconds(end), " " + text)
+                        break
+        else:
+            return SegmentStore.from_result({'text': f.read()})
+    return store
+
+
+def read_notes(path):
+    """(title, [(heading, text)]) for a notes file, one section per heading"""
+    title = None
+    sections = []
+    heading, lines = None, []
+    in_code = False
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.lstrip().startswith('```'):
+                in_code = not in_code
+            # "# comment" lines inside code blocks aren't headings
+            match = None if in_code else HEADING.match(line.rstrip('\n'))
+            if not match:
+                lines.append(line)
+                continue
+            if match.group(1) == '#' and title is None:
+                title = match.group(2).strip()
+            if "".join(lines).strip():
+                sections.append((heading, "".join(lines).strip()))
+            heading, lines = match.group(2).strip(), []
+    if "".join(lines).strip():
+        sections.append((heading, "".join(lines).strip()))
+    return title or os.path.splitext(os.path.basename(path))[0], sections
+
+
+def _clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+class SearchIndex:
+    """SQLite FTS5 index over generated notes and transcripts.
+
+    Transcripts are indexed one segment per passage with its timestamps, so a
+    hit points at the moment in the recording it came from; notes one section
+    per heading. Each document remembers its file's size and mtime, so
+    reindex() only rereads what changed. Safe to use from several threads."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            # Raises OperationalError where SQLite was built without FTS5
+            self.db.executescript(SCHEMA)
+
+    def add(self, path, kind, passages, source=None, title=None):
+        """Replace whatever was indexed for path with passages, a list of
+        (start_seconds, end_seconds, heading, text). Returns how many."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock, self.db:
+            row = self.db.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+            if row:
+                self.db.execute("DELETE FROM passages WHERE document = ?", (row['id'],))
+            self.db.execute(
+                "INSERT INTO documents (path, kind, source, title, size, mtime_ns, indexed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, source = excluded.source,"
+                " title = excluded.title, size = excluded.size, mtime_ns = excluded.mtime_ns,"
+                " indexed = excluded.indexed",
+                (path, kind, source and os.path.abspath(source), title, stat.st_size, stat.st_mtime_ns, time.time()))
+            document = self.db.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()['id']
+            self.db.executemany(
+                "INSERT INTO passages (document, start_seconds, end_seconds, heading, text) VALUES (?, ?, ?, ?, ?)",
+                [(document, start, end, heading, text) for start, end, heading, text in passages])
+        return len(passages)
+
+    def add_transcript(self, path, transcript, source=None):
+        """Index a transcript (a SegmentStore) written to path"""
+        passages = [(start, end, None, text.strip()) for _, start, end, text in transcript.rows() if text.strip()]
+        if not passages and transcript.text.strip():
+            # No timings, e.g. a .txt transcript
+            passages = [(None, None, None, transcript.text.strip())]
+        title = os.path.splitext(os.path.basename(source or path))[0]
+        return self.add(path, "transcript", passages, source, title)
+
+    def add_notes(self, path, source=None):
+        """Index the notes file at path, one passage per section"""
+        title, sections = read_notes(path)
+        return self.add(path, "notes", [(None, None, heading, text) for heading, text in sections], source, title)
+
+    def remove(self, path):
+        with self.lock, self.db:
+            row = self.db.execute("SELECT id FROM documents WHERE path = ?", (os.path.abspath(path),)).fetchone()
+            if row:
+                self.db.execute("DELETE FROM passages WHERE document = ?", (row['id'],))
+                self.db.execute("DELETE FROM documents WHERE id = ?", (row['id'],))
+
+    def documents(self):
+        with self.lock:
+            return [dict(row) for row in self.db.execute("SELECT * FROM documents ORDER BY path")]
+
+    def search(self, query, kind=None, limit=20, raw=False):
+        """Best matching passages for query, each with its document, the
+        seconds it covers in the source recording (transcripts) and a
+        snippet with the matches in [brackets]. query is a list of words
+        unless raw, in which case it is passed to FTS5 as-is."""
+        sql = ("SELECT d.kind, d.path, d.source, d.title, p.start_seconds, p.end_seconds, p.heading,"
+               " snippet(passages_fts, 0, '[', ']', '...', 16) AS snippet, bm25(passages_fts) AS score"
+               " FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid"
+               " JOIN documents d ON d.id = p.document WHERE passages_fts MATCH ?")
+        params = [query if raw else match_query(query)]
+        if kind:
+            sql += " AND d.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = [dict(row) for row in self.db.execute(sql, params)]
+        for hit in rows:
+            hit['score'] = round(-hit['score'], 3)
+            start = hit['start_seconds']
+            if start is not None:
+                hit['timestamp'] = _clock(start)
+            target = hit['source'] or hit['path']
+            # Media fragment: players and browsers that understand it start at the hit
+            hit['link'] = Path(target).as_uri() + (f"#t={start:.1f}" if start is not None and hit['source'] else "")
+        return rows
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT kind, COUNT(*) FROM documents GROUP BY kind").fetchall())
+            passages = self.db.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {'path': str(self.path), 'notes': counts.get('notes', 0), 'transcripts': counts.get('transcript', 0),
+                'passages': passages}
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM passages")
+            self.db.execute("DELETE FROM documents")
+            self.db.execute("INSERT INTO passages_fts (passages_fts) VALUES ('rebuild')")
+
+    def optimize(self):
+        """Merge the FTS index segments; worth it after a large reindex"""
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO passages_fts (passages_fts) VALUES ('optimize')")
+
+    def reindex(self, roots=(), force=False, sources=None):
+        """Bring the index up to date with the notes (.md) and transcripts
+        under roots (files or directories, searched recursively) and with
+        every document already indexed: new or changed files are read,
+        unchanged ones skipped unless force, vanished ones dropped.
+
+        sources maps output paths to the recording they came from, e.g. from
+        the job store; otherwise a recording with the same name beside a
+        transcript is taken as its source. Returns counts of what happened."""
+        sources = {os.path.abspath(path): source for path, source in (sources or {}).items()}
+        known = {document['path']: document for document in self.documents()}
+        counts = {'indexed': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+        for path in list(known):
+            if not os.path.isfile(path):
+                self.remove(path)
+                del known[path]
+                counts['removed'] += 1
+        candidates = set(known)
+        for root in roots:
+            candidates.update(self.find_documents(root))
+        chosen = self.preferred(candidates)
+        for path in set(known).difference(chosen):
+            # Superseded by a richer transcript of the same recording
+            self.remove(path)
+            del known[path]
+            counts['removed'] += 1
+
+        for path in sorted(chosen):
+            document = known.get(path)
+            stat = os.stat(path)
+            if document and not force and (document['size'], document['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                counts['unchanged'] += 1
+                continue
+            source = sources.get(path) or (document and document['source'])
+            try:
+                if path.endswith('.md'):
+                    self.add_notes(path, source)
+                else:
+                    transcript = read_transcript(path)
+                    if transcript is None:
+                        continue
+                    self.add_transcript(path, transcript, source or self.sibling_recording(path))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Warning: could not index {path}: {e}", file=sys.stderr)
+                counts['failed'] += 1
+                continue
+            counts['indexed'] += 1
+        if counts['indexed']:
+            self.optimize()
+        return counts
+
+    @staticmethod
+    def find_documents(root):
+        extensions = {'.md'} | {f'.{fmt}' for fmt in TRANSCRIPT_FORMATS}
+        if os.path.isfile(root):
+            return [os.path.abspath(root)]
+        found = []
+        for parent, subdirs, names in os.walk(root):
+            # Caches, job and index databases and .part files live in hidden paths
+            subdirs[:] = [d for d in subdirs if not d.startswith('.')]
+            for name in names:
+                if not name.startswith('.') and os.path.splitext(name)[1].lower() in extensions:
+                    found.append(os.path.abspath(os.path.join(parent, name)))
+        return found
+
+    @staticmethod
+    def preferred(paths):
+        """paths without the transcripts that have a richer sibling of the
+        same name (only one format per recording is indexed)"""
+        best = {}
+        kept = []
+        for path in paths:
+            stem, ext = os.path.splitext(path)
+            fmt = ext.lstrip('.').lower()
+            if fmt not in TRANSCRIPT_FORMATS:
+                kept.append(path)
+            elif stem not in best or TRANSCRIPT_FORMATS.index(fmt) < TRANSCRIPT_FORMATS.index(best[stem][0]):
+                best[stem] = (fmt, path)
+        return kept + [path for _, path in best.values()]
+
+    @staticmethod
+    def sibling_recording(path):
+        stem = os.path.splitext(path)[0]
+        for ext in sorted(MEDIA_EXTENSIONS):
+            if os.path.isfile(stem + ext):
+                return stem + ext
+        return None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
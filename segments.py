@@ -0,0 +1,95 @@
+from array import array
+
+__all__ = ['Segment', 'SegmentStore']
+
+
+class Segment:
+    """One transcript segment. Supports segment['start'] and segment.get()
+    so it can stand in for whisper's segment dicts."""
+    __slots__ = ('start', 'end', 'text')
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"Segment({self.start!r}, {self.end!r}, {self.text!r})"
+
+
+class SegmentStore:
+    """Column store for a transcript: start and end times in array('d'),
+    texts concatenated into one string indexed by array('q') offsets.
+
+    That is about 24 bytes per segment plus its text, where a whisper segment
+    dict with its tokens and log-probabilities runs to a kilobyte or more.
+    Other per-segment fields are kept only when asked for (keep_extras), for
+    formats such as JSON that write them out."""
+    def __init__(self, language='unknown', keep_extras=False):
+        self.language = language
+        self.starts = array('d')
+        self.ends = array('d')
+        self.offsets = array('q', [0])
+        self.extras = [] if keep_extras else None
+        self._text = ""
+        self._pending = []
+
+    @classmethod
+    def from_result(cls, result, keep_extras=False):
+        store = cls(result.get('language', 'unknown'), keep_extras)
+        segments = result.get('segments') or []
+        if not segments:
+            # No timings to keep, but the plain text is still worth writing
+            store._text = result.get('text', "")
+            return store
+        for segment in segments:
+            extra = None
+            if keep_extras:
+                extra = {k: v for k, v in segment.items() if k not in Segment.__slots__}
+            store.append(segment['start'], segment['end'], segment['text'], extra)
+        return store
+
+    def append(self, start, end, text, extra=None):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.offsets.append(self.offsets[-1] + len(text))
+        self._pending.append(text)
+        if self.extras is not None:
+            self.extras.append(extra or {})
+
+    @property
+    def text(self):
+        """The whole transcript: every segment's text, concatenated"""
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = []
+        return self._text
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        text = self.text
+        return Segment(self.starts[index], self.ends[index], text[self.offsets[index]:self.offsets[index + 1]])
+
+    def __iter__(self):
+        for _, start, end, text in self.rows():
+            yield Segment(start, end, text)
+
+    def rows(self):
+        """(index, start, end, text) for every segment, index starting at 1;
+        cheaper than iterating Segments when writing files"""
+        text = self.text
+        offsets = self.offsets
+        for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+            yield i + 1, start, end, text[offsets[i]:offsets[i + 1]]
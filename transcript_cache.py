@@ -0,0 +1,60 @@
+import hashlib
+import os
+import sys
+
+from disk_cache import DiskCache, cache_key
+
+__all__ = ['file_digest', 'TranscriptCache']
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Options that only change what gets printed, not the transcription itself
+IGNORED_OPTIONS = {'verbose'}
+
+_digest_memo = {}
+
+
+def file_digest(file_path):
+    """Streaming BLAKE2b digest of a file's contents.
+
+    Memoised per process on (path, size, mtime) so a file is only read once
+    per run even if several lookups need its key."""
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    _digest_memo[memo_key] = digest.hexdigest()
+    return _digest_memo[memo_key]
+
+
+class TranscriptCache(DiskCache):
+    """On-disk cache of Whisper results keyed on media content, model and options.
+
+    Each entry holds the result (text, segments, language) plus the source
+    path and model, evicted least-recently-used past max_bytes."""
+    def key(self, file_path, model_name, options=None):
+        options = {k: v for k, v in (options or {}).items() if k not in IGNORED_OPTIONS}
+        return cache_key(media=file_digest(file_path), model=model_name, options=options)
+
+    def contains(self, file_path, model_name, options=None):
+        return self.path_for(self.key(file_path, model_name, options)).exists()
+
+    def fetch_or_transcribe(self, file_path, model_name, options, transcribe):
+        """Return (result, hit), calling transcribe() and storing its result on a miss"""
+        key = self.key(file_path, model_name, options)
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        result = transcribe()
+        try:
+            self.put(key, {
+                'text': result['text'],
+                'segments': result.get('segments', []),
+                'language': result.get('language', 'unknown'),
+            }, source=os.path.abspath(file_path), model=model_name)
+        except OSError as e:
+            print(f"Warning: could not write transcription cache entry: {e}", file=sys.stderr)
+        return result, False
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+
+from utils import format_timestamp
+
+__all__ = ['FORMATS', 'INCREMENTAL_FORMATS', 'parse_formats', 'format_block', 'write_transcripts', 'IncrementalWriter']
+
+FORMATS = ["srt", "vtt", "txt", "json", "jsonl"]
+
+# Formats whose files are a header plus one block per segment
+INCREMENTAL_FORMATS = {"srt": "", "vtt": "WEBVTT\n\n"}
+
+
+def parse_formats(selection):
+    """Formats from a selection: one name, a comma-separated string or an
+    iterable of names. Returned without duplicates, in FORMATS order."""
+    if isinstance(selection, str):
+        selection = selection.split(',')
+    selected = {fmt.strip().lower() for fmt in selection if fmt and fmt.strip()}
+    unknown = selected.difference(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown transcript format: {', '.join(sorted(unknown))}")
+    return [fmt for fmt in FORMATS if fmt in selected]
+
+
+def format_block(fmt, index, start, end, text):
+    """The text one segment contributes to an SRT or VTT file (index is 1-based)"""
+    if fmt == "vtt":
+        return f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text.strip()}\n\n"
+    return f"{index}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text.strip()}\n\n"
+
+
+def _json_header(store):
+    return ('{"text":' + json.dumps(store.text, ensure_ascii=False)
+            + ',"language":' + json.dumps(store.language) + ',"segments":[')
+
+
+def _json_segment(store, index, start, end, text):
+    segment = {'id': index - 1, 'start': start, 'end': end, 'text': text}
+    if store.extras is not None:
+        segment.update(store.extras[index - 1])
+    # One segment per line: compact, yet still readable and diffable
+    return (",\n" if index > 1 else "\n") + json.dumps(segment, ensure_ascii=False, separators=(',', ':'))
+
+
+def _jsonl_segment(store, index, start, end, text):
+    return json.dumps({'start': start, 'end': end, 'text': text.strip()},
+                      ensure_ascii=False, separators=(',', ':')) + "\n"
+
+
+# fmt: (header(store), block(store, index, start, end, text) or None, footer(store))
+WRITERS = {
+    "srt": (lambda store: "", lambda store, *row: format_block("srt", *row), lambda store: ""),
+    "vtt": (lambda store: INCREMENTAL_FORMATS["vtt"], lambda store, *row: format_block("vtt", *row),
+            lambda store: ""),
+    # The store already holds the text in one piece
+    "txt": (lambda store: store.text, None, lambda store: ""),
+    "json": (_json_header, _json_segment, lambda store: "\n]}\n"),
+    "jsonl": (lambda store: "", _jsonl_segment, lambda store: ""),
+}
+
+
+def write_transcripts(store, outputs):
+    """Write a SegmentStore to every {format: path} in outputs, in a single
+    pass over its segments. Formats are listed in FORMATS."""
+    files = {fmt: open(path, 'w', encoding='utf-8') for fmt, path in outputs.items()}
+    try:
+        for fmt, f in files.items():
+            f.write(WRITERS[fmt][0](store))
+        blocks = [(WRITERS[fmt][1], f.write) for fmt, f in files.items() if WRITERS[fmt][1]]
+        if blocks:
+            for row in store.rows():
+                for block, write in blocks:
+                    write(block(store, *row))
+        for fmt, f in files.items():
+            f.write(WRITERS[fmt][2](store))
+    finally:
+        for f in files.values():
+            f.close()
+
+
+class IncrementalWriter:
+    """Writes SRT/VTT blocks as segments arrive, to a hidden .part file next to
+    the output that replaces it once the final result is known.
+
+    commit() checks the streamed blocks against the final transcript and
+    rewrites the file from it if they differ, e.g. when the chunks of a split
+    file arrive out of order."""
+    def __init__(self, output_path, fmt):
+        directory, name = os.path.split(output_path)
+        self.output_path = output_path
+        self.fmt = fmt
+        self.part_path = os.path.join(directory, f".{name}.part")
+        self.lock = threading.Lock()
+        self.file = None
+        self.blocks = []
+        self.in_order = True
+        self.last_start = None
+
+    def add(self, segment):
+        with self.lock:
+            if not self.in_order:
+                return
+            if self.last_start is not None and segment['start'] < self.last_start:
+                self.in_order = False
+                return
+            self.last_start = segment['start']
+            if self.file is None:
+                self.file = open(self.part_path, 'w', encoding='utf-8')
+                self.file.write(INCREMENTAL_FORMATS[self.fmt])
+            block = format_block(self.fmt, len(self.blocks) + 1, segment['start'], segment['end'], segment['text'])
+            self.blocks.append(block)
+            self.file.write(block)
+            # Let anyone tailing the file see each segment as it lands
+            self.file.flush()
+
+    def commit(self, store):
+        """Move the streamed file into place, or write it from the SegmentStore
+        if the stream doesn't match; returns the output path"""
+        with self.lock:
+            self.close()
+            if self.in_order and self.blocks and len(self.blocks) == len(store) and \
+                    all(block == format_block(self.fmt, *row) for block, row in zip(self.blocks, store.rows())):
+                os.replace(self.part_path, self.output_path)
+                return self.output_path
+            self.discard()
+        write_transcripts(store, {self.fmt: self.output_path})
+        return self.output_path
+
+    def abort(self):
+        with self.lock:
+            self.close()
+            self.discard()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
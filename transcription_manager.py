@@ -1,85 +1,309 @@
-import whisper
 import threading
 import time
 import os
 import re
-import json
 import sys
-import io
-from contextlib import redirect_stdout
-from utils import format_timestamp
 from notes_manager import NotesManager
-from queue import Queue
+from scheduler import TranscriptionScheduler
+from pipeline import NotesStage, StageStats, AudioPrefetcher, WriteStage, FileCompletion
+from transcript_cache import TranscriptCache
+from pcm_cache import PcmCache
+from backends import model_key
+from model_pool import ModelPool
+from progress import ProgressTracker, format_segment_line, media_duration
+from transcript_writer import INCREMENTAL_FORMATS, IncrementalWriter, parse_formats, write_transcripts
+from segments import SegmentStore
+from job_store import JobStore
+from metrics import PipelineMetrics
+from search_index import TRANSCRIPT_FORMATS, SearchIndex
+from config import (NOTES_CONCURRENCY, NOTES_QUEUE_SIZE, TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB,
+                    LONG_MEDIA_SECONDS, LONG_MEDIA_CHUNK_SECONDS, PCM_CACHE_DIR, PCM_CACHE_MAX_MB,
+                    PREFETCH_WORKERS, TRANSCRIBE_BACKEND, MODEL_POOL_SIZE, MODEL_POOL_MAX_MB,
+                    UI_UPDATE_INTERVAL_MS, JOB_STORE_PATH, METRICS_PATH, METRICS_PROMETHEUS_PATH,
+                    SEARCH_INDEX_PATH)
+from queue import Empty, Queue
 from threading import Thread
 
 class TranscriptionManager:
-    def __init__(self, ui):
+    def __init__(self, ui, model_name="small", echo_stdout=True, workers=1,
+                 notes_concurrency=NOTES_CONCURRENCY, notes_queue_size=NOTES_QUEUE_SIZE, use_cache=True,
+                 notes_options=None, long_media_seconds=LONG_MEDIA_SECONDS, backend=TRANSCRIBE_BACKEND,
+                 preload=True, job_store_path=JOB_STORE_PATH, metrics_path=METRICS_PATH,
+                 prometheus_path=METRICS_PROMETHEUS_PATH, search_index_path=SEARCH_INDEX_PATH):
         self.ui = ui
-        self.model_name = "small"
-        self.model = whisper.load_model(self.model_name)
+        self.model_name = model_name
+        self.backend = backend
+        self.echo_stdout = echo_stdout
+        self.workers = max(1, workers)
+        self.scheduler = None
+        self.long_media_seconds = long_media_seconds
+        self.transcribe_options = {'verbose': True}
+        # Per-file timings from every stage, exported as each file finishes
+        self.metrics = PipelineMetrics(metrics_path, prometheus_path)
+        self.transcript_cache = None
+        if use_cache and TRANSCRIPT_CACHE_MAX_MB > 0:
+            self.transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+        # Decoded audio is kept as .npy so re-runs and model switches skip ffmpeg
+        self.pcm_cache = None
+        self.prefetcher = None
+        if use_cache and PCM_CACHE_MAX_MB > 0:
+            self.pcm_cache = PcmCache(PCM_CACHE_DIR, PCM_CACHE_MAX_MB * 1024 * 1024)
+            if workers == 1:
+                self.prefetcher = AudioPrefetcher(self.pcm_cache, PREFETCH_WORKERS, skip=self.is_cached,
+                                                  metrics=self.metrics)
+        # Files remember the model, formats and output directory selected when they were queued
+        self.file_models = {}
+        self.file_outputs = {}
+        # Files claimed and not yet finished, so dropping one twice doesn't queue it twice
+        self.active = set()
+        # Resumed files whose transcripts were written by an earlier session
+        self.notes_only = set()
+        self.jobs = None
+        if job_store_path:
+            try:
+                self.jobs = JobStore(job_store_path)
+            except Exception as e:
+                print(f"Warning: Could not open job store: {e}", file=sys.stderr)
+        self.index = None
+        if search_index_path:
+            try:
+                self.index = SearchIndex(search_index_path)
+            except Exception as e:
+                print(f"Warning: Could not open search index: {e}", file=sys.stderr)
+        # With a worker pool each process keeps its own models, so the in-process pool stays empty
+        self.models = ModelPool(self.backend, MODEL_POOL_SIZE, MODEL_POOL_MAX_MB * 1024 * 1024)
+        if preload:
+            self.preload()
         self.file_queue = []
         self.processing_queue = False
         self.transcribing = False
         self.progress_value = 0
         self.output_queue = Queue()
+        self.writers = {}
         self.start_output_worker()
         try:
-            self.notes_manager = NotesManager()
+            self.notes_manager = NotesManager(use_cache=use_cache, **(notes_options or {}))
         except Exception as e:
-            print(f"Warning: Could not initialize NotesManager: {e}")
+            print(f"Warning: Could not initialize NotesManager: {e}", file=sys.stderr)
             self.notes_manager = None
+        self.transcribe_stats = StageStats("transcribe", self.metrics)
+        self.write_stage = WriteStage(metrics=self.metrics)
+        self.notes_stage = NotesStage(self.ui, self.notes_manager, notes_concurrency, notes_queue_size,
+                                      output=self.output_queue.put, on_result=self.notes_finished,
+                                      metrics=self.metrics)
 
     def start_output_worker(self):
-        """Start a worker thread to process output queue"""
+        """Start a worker thread that forwards output_queue to the UI.
+
+        The queue carries text lines, ("segment", file, segment) and
+        ("progress", file, percent, eta) items from any thread. They are
+        delivered in batches, at most one round of UI calls per update
+        interval, so a fast transcription can't flood the UI's event loop."""
+        interval = UI_UPDATE_INTERVAL_MS / 1000
+
         def worker():
-            while True:
-                text = self.output_queue.get()
-                if text == "STOP":
-                    break
-                self.ui.update_output(text)
-                self.output_queue.task_done()
+            running = True
+            while running:
+                items = [self.output_queue.get()]
+                deadline = time.monotonic() + interval
+                while items[-1] != "STOP":
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(self.output_queue.get(timeout=remaining))
+                    except Empty:
+                        break
+                running = self.dispatch_output(items)
 
         self.output_thread = Thread(target=worker, daemon=True)
         self.output_thread.start()
 
-    def custom_stdout_redirect(self):
-        """Custom stdout redirect that updates UI in real-time"""
-        class CustomStdout:
-            def __init__(self, queue):
-                self.queue = queue
-                self.buffer = ""
-
-            def write(self, text):
-                self.buffer += text
-                if '\n' in self.buffer:
-                    lines = self.buffer.split('\n')
-                    for line in lines[:-1]:
-                        if line.strip():
-                            self.queue.put(line)
-                    self.buffer = lines[-1]
-                sys.__stdout__.write(text)
-
-            def flush(self):
-                if self.buffer:
-                    self.queue.put(self.buffer)
-                    self.buffer = ""
+    def dispatch_output(self, items):
+        """Deliver one batch from output_queue: consecutive lines as a single
+        update_output, consecutive segments of a file as a single
+        update_segments, and only the latest progress of each file.
+        Returns False once the batch contains "STOP"."""
+        runs = []
+        progress = {}
+        running = True
+        for item in items:
+            if item == "STOP":
+                running = False
+                break
+            if isinstance(item, str):
+                key, value = ("output", None), item
+            elif item[0] == "segment":
+                key, value = ("segment", item[1]), item[2]
+            else:
+                progress[item[1]] = item[2:]
+                continue
+            if runs and runs[-1][0] == key:
+                runs[-1][1].append(value)
+            else:
+                runs.append((key, [value]))
+
+        for (kind, file_path), values in runs:
+            if kind == "output":
+                self.ui.update_output("\n".join(values))
+                lines = values
+            else:
+                self.ui.update_segments(file_path, values)
+                lines = [format_segment_line(segment) for segment in values]
+            if self.echo_stdout:
+                sys.__stdout__.write("\n".join(lines) + "\n")
                 sys.__stdout__.flush()
+        for file_path, (percent, eta) in progress.items():
+            self.ui.update_progress(file_path, percent, eta)
+        return running
+
+    def segment_arrived(self, file_path, segment, tracker):
+        """Called from the transcribing thread for every decoded segment"""
+        for writer in self.writers.get(file_path, {}).values():
+            self.write_stage.stream(writer.add, segment)
+        metrics = self.metrics.file(file_path)
+        if metrics.audio_seconds is None:
+            metrics.audio_seconds = tracker.duration
+        self.output_queue.put(("segment", file_path, segment))
+        self.output_queue.put(("progress", file_path, tracker.percent(), tracker.eta()))
+
+    def selected_formats(self, file_path=None):
+        """Formats to write file_path in: those selected when it was queued,
+        or else the current selection"""
+        if file_path in self.file_outputs:
+            return self.file_outputs[file_path][0]
+        return parse_formats(self.ui.format_var.get())
 
-        return CustomStdout(self.output_queue)
+    def open_writer(self, file_path):
+        """Start streaming the transcript to disk in the selected formats that allow it"""
+        writers = {fmt: IncrementalWriter(self.get_output_path(file_path, fmt), fmt)
+                   for fmt in self.selected_formats(file_path) if fmt in INCREMENTAL_FORMATS}
+        if writers:
+            self.writers[file_path] = writers
+
+    def abort_writer(self, file_path):
+        for writer in self.writers.pop(file_path, {}).values():
+            # Queued behind the segments still being written to it
+            self.write_stage.stream(writer.abort)
+
+    def preload(self):
+        """Start loading the current model in the background"""
+        if self.workers == 1:
+            self.models.warm(self.model_name)
 
     def on_model_change(self, new_model):
         if new_model != self.model_name:
-            if self.processing_queue or self.transcribing:
-                self.ui.update_status("Wait until current transcription completes to switch model.")
-                self.ui.model_var.set(self.model_name)
-                return
-            threading.Thread(target=self.load_new_model, args=(new_model,), daemon=True).start()
+            self.load_new_model(new_model)
 
     def load_new_model(self, new_model):
-        self.ui.update_status(f"Loading {new_model} model...")
-        self.model = whisper.load_model(new_model)
+        """Make new_model the one used for files queued from now on. Files
+        already queued keep theirs, so this is safe mid-batch."""
         self.model_name = new_model
-        self.ui.update_status("Model loaded. Ready for transcription.")
+        if self.scheduler is not None:
+            # Workers load it on demand; respawned workers start with it
+            self.scheduler.model_name = new_model
+        if self.workers > 1 or self.models.is_resident(new_model):
+            self.ui.update_status(f"Switched to {new_model} model. Ready for transcription.")
+            return
+        self.ui.update_status(f"Loading {new_model} model...")
+
+        def loaded(future):
+            if future.exception() is not None:
+                self.ui.update_status(f"Could not load {new_model} model: {future.exception()}")
+            elif self.model_name == new_model:
+                self.ui.update_status("Model loaded. Ready for transcription.")
+
+        self.models.warm(new_model).add_done_callback(loaded)
+
+    def model_for(self, file_path):
+        return self.file_models.get(file_path, self.model_name)
+
+    def is_cached(self, file_path):
+        """Whether a transcription of file_path with its model is already cached"""
+        if not self.transcript_cache:
+            return False
+        try:
+            return self.transcript_cache.contains(file_path, model_key(self.backend, self.model_for(file_path)),
+                                                  self.transcribe_options)
+        except OSError:
+            return False
+
+    def get_scheduler(self):
+        if self.scheduler is None:
+            cache = self.transcript_cache
+            self.scheduler = TranscriptionScheduler(
+                self.model_name, self.workers, self.transcribe_options,
+                cache_dir=cache.cache_dir if cache else None,
+                cache_max_bytes=cache.max_bytes if cache else 0,
+                long_media_seconds=self.long_media_seconds,
+                chunk_seconds=LONG_MEDIA_CHUNK_SECONDS,
+                pcm_cache_dir=self.pcm_cache.cache_dir if self.pcm_cache else None,
+                pcm_cache_max_bytes=self.pcm_cache.max_bytes if self.pcm_cache else 0,
+                backend=self.backend,
+                model_pool_size=self.models.max_models,
+                model_pool_max_bytes=self.models.max_bytes,
+            )
+        return self.scheduler
+
+    def shutdown_scheduler(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+            self.scheduler = None
+
+    def claim(self, files, model_name=None, formats=None, output_dir=None):
+        """Take files on as jobs with the given settings (by default the ones
+        selected now) and return those that need work. Files already queued
+        are left out, and so, with a job store, are files an identical job
+        already finished. Paths come back absolute."""
+        model_name = model_name or self.model_name
+        formats = parse_formats(formats) if formats is not None else self.selected_formats()
+        output_dir = self.ui.output_dir_var.get().strip() if output_dir is None else output_dir
+        claimed = []
+        for file_path in map(os.path.abspath, files):
+            if file_path in self.active:
+                continue
+            if self.jobs:
+                stage = self.jobs.add(file_path, self.backend, model_name, formats, output_dir)
+                if stage is None:
+                    continue
+                if stage == "transcribed":
+                    self.notes_only.add(file_path)
+            self.active.add(file_path)
+            self.file_models[file_path] = model_name
+            self.file_outputs[file_path] = (formats, output_dir)
+            claimed.append(file_path)
+        return claimed
+
+    def claim_pending(self):
+        """Claim the jobs an earlier session left unfinished, with the settings
+        they were queued with"""
+        if not self.jobs:
+            return []
+        claimed = []
+        for job in self.jobs.pending():
+            if not os.path.isfile(job['source']):
+                self.jobs.fail(job['source'], "File not found")
+                continue
+            claimed += self.claim([job['source']], job['model'], job['formats'], job['output_dir'])
+        return claimed
+
+    def release(self, on_done=None):
+        """Wrap a file's on_done so the file can be queued again once it's finished"""
+        def done(file_path, ok):
+            self.active.discard(file_path)
+            self.notes_only.discard(file_path)
+            self.file_outputs.pop(file_path, None)
+            self.metrics.finish(file_path, ok)
+            if on_done:
+                on_done(file_path, ok)
+        return done
+
+    def resume_jobs(self):
+        """Queue whatever an earlier session left unfinished"""
+        files = self.claim_pending()
+        if files:
+            self.ui.update_status(f"Resuming {len(files)} unfinished file(s).")
+            self.queue_files(files)
 
     def handle_drop(self, event):
         file_paths = self.parse_file_list(event.data)
@@ -88,9 +312,18 @@ class TranscriptionManager:
             self.ui.update_status("No valid files dropped.")
             return
 
-        self.file_queue.extend(valid_files)
-        self.ui.update_status(f"{len(valid_files)} file(s) added to queue.")
-        
+        files = self.claim(valid_files)
+        skipped = len(valid_files) - len(files)
+        status = f"{len(files)} file(s) added to queue."
+        if skipped:
+            status += f" {skipped} already queued or done."
+        self.ui.update_status(status)
+        self.queue_files(files)
+
+    def queue_files(self, files):
+        if not files:
+            return
+        self.file_queue.extend((fp, self.model_for(fp)) for fp in files)
         if not self.processing_queue:
             self.processing_queue = True
             threading.Thread(target=self.process_queue, daemon=True).start()
@@ -103,98 +336,289 @@ class TranscriptionManager:
 
     def process_queue(self):
         while self.file_queue:
-            file_path = self.file_queue.pop(0)
-            self.transcribe_file(file_path)
-            time.sleep(1)
+            batch = self.file_queue[:]
+            del self.file_queue[:len(batch)]
+            self.process_files([fp for fp, _ in batch], models=dict(batch))
         self.processing_queue = False
         self.ui.update_status("All files processed.")
+        self.ui.update_output(self.format_stage_stats())
+        if self.metrics.finished:
+            self.ui.update_output(self.metrics.format_summary())
+        notes_cache = self.notes_manager.cache_stats() if self.notes_manager else None
+        if notes_cache:
+            self.ui.update_output(f"Notes cache - {notes_cache['hits']} hits, {notes_cache['misses']} misses")
+        if self.notes_manager:
+            client = self.notes_manager.client_stats()
+            self.ui.update_output(f"Gemini requests - {client['attempts']} sent, {client['retries']} retried, "
+                                  f"{client['failures']} failed, {client['throttled_seconds']}s throttled")
+
+    def warm_models(self, files):
+        """Load the models the next files need in the background, in file order,
+        but no more than the pool holds so none evicts another before its turn"""
+        upcoming = dict.fromkeys(self.model_for(f) for f in files)
+        for model_name in list(upcoming)[:self.models.max_models]:
+            self.models.warm(model_name)
 
-    def transcribe_file(self, file_path):
+    def process_files(self, files, on_file_start=None, on_file_done=None, models=None):
+        """Transcribe a batch of files, on the worker pool when one is configured.
+
+        Notes are generated by the notes stage while the next file transcribes;
+        this returns once both stages have drained. on_file_start(path) is called
+        from this thread, on_file_done(path, ok) from whichever stage finishes the file.
+        models maps files to the model to use when it isn't the current one."""
+        self.file_models.update(models or {})
+        on_file_done = self.release(on_file_done)
+        files = [f for f in files if not self.resume_notes(f, on_file_start, on_file_done)]
+        if self.workers == 1 or not files:
+            if self.prefetcher:
+                self.prefetcher.prefetch(files)
+            for i, file_path in enumerate(files):
+                self.warm_models(files[i:])
+                if on_file_start:
+                    on_file_start(file_path)
+                self.transcribe_file(file_path, on_file_done)
+                self.file_models.pop(file_path, None)
+            self.write_stage.join()
+            self.notes_stage.join()
+            return
+
+        started_at = {}
+
+        def started(file_path):
+            started_at[file_path] = time.time()
+            self.metrics.start(file_path)
+            if on_file_start:
+                on_file_start(file_path)
+            self.open_writer(file_path)
+            self.ui.update_status(f"Transcribing: {os.path.basename(file_path)}")
+            self.ui.update_transcription_state("processing")
+
+        def finished(file_path, result):
+            self.transcribe_stats.record(started_at.pop(file_path, time.time()), time.time(), file_path=file_path)
+            try:
+                self.finish_file(file_path, result, on_file_done)
+            except Exception as e:
+                self.report_error(file_path, e)
+                if on_file_done:
+                    on_file_done(file_path, False)
+
+        def failed(file_path, message):
+            self.transcribe_stats.record(started_at.pop(file_path, time.time()), time.time(), ok=False,
+                                         file_path=file_path)
+            self.abort_writer(file_path)
+            self.report_error(file_path, message)
+            if on_file_done:
+                on_file_done(file_path, False)
+
+        self.transcribing = True
+        try:
+            self.get_scheduler().run(
+                files,
+                models={f: self.model_for(f) for f in files},
+                on_start=started,
+                on_result=finished,
+                on_error=failed,
+                on_output=self.output_queue.put,
+                on_segment=self.segment_arrived,
+            )
+        finally:
+            self.transcribing = False
+            for file_path in files:
+                self.file_models.pop(file_path, None)
+        self.write_stage.join()
+        self.notes_stage.join()
+
+    def transcribe_file(self, file_path, on_done=None):
+        """Transcribe one file in-process, handing its transcript to the write
+        and notes stages. Returns True if it was transcribed."""
         base_name = os.path.basename(file_path)
         self.ui.update_status(f"Transcribing: {base_name}")
         self.ui.update_transcription_state("processing")
         self.transcribing = True
+        started = time.time()
+        self.metrics.start(file_path)
         
         try:
-            # Redirect stdout to our custom handler
-            custom_stdout = self.custom_stdout_redirect()
-            old_stdout = sys.stdout
-            sys.stdout = custom_stdout
-
+            self.open_writer(file_path)
             try:
-                result = self.model.transcribe(
-                    file_path, 
-                    verbose=True,
-                )
+                result = self.run_model(file_path)
             finally:
-                # Restore stdout
-                sys.stdout = old_stdout
-                custom_stdout.flush()
-            
-            output_path = self.get_output_path(file_path)
-            
-            # Generate transcription in selected format
-            if self.ui.format_var.get() == "srt":
-                self.generate_srt(result, output_path)
-            elif self.ui.format_var.get() == "vtt":
-                self.generate_vtt(result, output_path)
-            elif self.ui.format_var.get() == "json":
-                self.generate_json(result, output_path)
-            else:
-                self.generate_txt(result, output_path)
-            
-            self.ui.update_transcription_state("completed")
-            
-            # Generate notes from transcription
-            if self.notes_manager:
-                self.ui.update_status(f"Generating notes for: {base_name}")
-                self.ui.update_notes_state("processing")
-                base_name_without_ext = os.path.splitext(base_name)[0]
-                notes_path = self.notes_manager.generate_notes(result["text"], base_name_without_ext)
-                self.ui.update_notes_state("completed")
-                self.ui.update_status(f"Completed: {base_name}\nNotes saved to: {notes_path}")
-            
+                if self.prefetcher:
+                    self.prefetcher.release(file_path)
+
+            self.transcribe_stats.record(started, time.time(), file_path=file_path)
+            self.finish_file(file_path, result, on_done)
+            return True
         except Exception as e:
-            self.ui.update_transcription_state("error")
-            self.ui.update_notes_state("error")
-            self.ui.update_status(f"Error with {base_name}: {str(e)}")
-            self.ui.update_output(f"Error: {str(e)}")
+            self.transcribe_stats.record(started, time.time(), ok=False, file_path=file_path)
+            self.abort_writer(file_path)
+            self.report_error(file_path, e)
+            if on_done:
+                on_done(file_path, False)
+            return False
         finally:
             self.transcribing = False
 
-    def get_output_path(self, input_file):
-        format_ext = self.ui.format_var.get()
+    def resume_notes(self, file_path, on_start=None, on_done=None):
+        """Queue just the notes for a file whose transcripts an earlier session
+        wrote, from the transcription cache. False if it has to be transcribed."""
+        if file_path not in self.notes_only:
+            return False
+        self.notes_only.discard(file_path)
+        if not (self.notes_manager and self.transcript_cache):
+            return False
+        key = self.transcript_cache.key(file_path, model_key(self.backend, self.model_for(file_path)),
+                                        self.transcribe_options)
+        result = self.transcript_cache.get(key)
+        if result is None:
+            return False
+        if on_start:
+            on_start(file_path)
+        self.metrics.start(file_path)
+        self.output_queue.put(f"Resuming notes for {os.path.basename(file_path)}")
+        self.notes_stage.submit(file_path, SegmentStore.from_result(result), on_done)
+        self.file_models.pop(file_path, None)
+        return True
+
+    def run_model(self, file_path):
+        """Transcribe with the file's model from the in-process pool, reusing a
+        cached result when one exists"""
+        model_name = self.model_for(file_path)
+
+        def transcribe():
+            model = self.models.get(model_name)
+            audio = self.load_audio(file_path)
+            tracker = ProgressTracker(media_duration(audio, file_path))
+
+            def on_segment(segment):
+                tracker.advance(segment['end'])
+                self.segment_arrived(file_path, segment, tracker)
+
+            # Whisper's other console lines (language detection) become output,
+            # echoed to stdout only when echo_stdout is set
+            return model.transcribe(audio, on_segment=on_segment, on_line=self.output_queue.put,
+                                    **self.transcribe_options)
+
+        if not self.transcript_cache:
+            return transcribe()
+        result, hit = self.transcript_cache.fetch_or_transcribe(
+            file_path, model_key(self.backend, model_name), self.transcribe_options, transcribe)
+        if hit:
+            self.metrics.file(file_path).count('transcript_cache_hits')
+            self.output_queue.put(f"Loaded cached transcription for {os.path.basename(file_path)}")
+        return result
+
+    def load_audio(self, file_path):
+        """Memory-mapped PCM from the prefetch stage, or the path for Whisper to decode itself"""
+        if not self.prefetcher:
+            return file_path
+        return self.pcm_cache.load(self.prefetcher.get(file_path))
+
+    def finish_file(self, file_path, result, on_done=None):
+        """Queue the transcript for writing in every selected format and for
+        notes generation; both work from the same in-memory transcript.
+
+        Blocks only if the write or notes stage is already holding its maximum
+        backlog. on_done(file_path, ok) runs once both stages are done."""
+        formats = self.selected_formats(file_path)
+        # Only the compact transcript is kept from here on, not whisper's full result
+        transcript = SegmentStore.from_result(result, keep_extras="json" in formats)
+        metrics = self.metrics.file(file_path)
+        if metrics.audio_seconds is None and len(transcript):
+            # Nothing streamed, e.g. a cached result: the transcript's end is close enough
+            metrics.audio_seconds = transcript.ends[-1]
+        if result.get('cached'):
+            metrics.count('transcript_cache_hits')
+        if result.get('decode_seconds') is not None:
+            metrics.timing("decode", result['decode_seconds'])
+        metrics.gauge('worker_peak_rss_mb', result.get('worker_peak_rss_mb'))
+        writers = self.writers.pop(file_path, {})
+        outputs = {fmt: self.get_output_path(file_path, fmt) for fmt in formats if fmt not in writers}
+        paths = dict(outputs, **{fmt: writer.output_path for fmt, writer in writers.items()})
+        done = FileCompletion(file_path, on_done, 2 if self.notes_manager else 1)
+
+        def write():
+            for writer in writers.values():
+                # Already streamed while transcribing; this just moves it into place
+                writer.commit(transcript)
+            if outputs:
+                write_transcripts(transcript, outputs)
+            if self.index:
+                self.index_transcript(file_path, transcript, paths)
+
+        def written(error):
+            if error is not None:
+                self.report_error(file_path, error)
+            else:
+                if self.jobs:
+                    self.jobs.transcribed(file_path, paths, final=not self.notes_manager)
+                self.ui.update_transcription_state("completed")
+            done(file_path, error is None)
+
+        self.write_stage.submit(write, written, file_path)
+
+        # Generate notes from transcription
+        if self.notes_manager:
+            self.notes_stage.submit(file_path, transcript, done)
+
+    def index_transcript(self, file_path, transcript, paths):
+        """Add a written transcript to the search index, under the richest of
+        its output files. Indexing failures only cost searchability."""
+        fmt = next((fmt for fmt in TRANSCRIPT_FORMATS if fmt in paths), None)
+        if fmt is None:
+            return
+        try:
+            self.index.add_transcript(paths[fmt], transcript, source=file_path)
+        except Exception as e:
+            print(f"Warning: could not index transcript of {file_path}: {e}", file=sys.stderr)
+
+    def notes_finished(self, file_path, notes_path, error):
+        if self.index and error is None:
+            try:
+                self.index.add_notes(notes_path, source=file_path)
+            except Exception as e:
+                print(f"Warning: could not index notes {notes_path}: {e}", file=sys.stderr)
+        if self.jobs:
+            if error is None:
+                self.jobs.notes_done(file_path, notes_path)
+            else:
+                self.jobs.notes_failed(file_path, f"Notes: {error}")
+
+    def report_error(self, file_path, error):
+        if self.jobs:
+            self.jobs.fail(file_path, error)
+        base_name = os.path.basename(file_path)
+        self.ui.update_transcription_state("error")
+        self.ui.update_notes_state("error")
+        self.ui.update_status(f"Error with {base_name}: {str(error)}")
+        self.ui.update_output(f"Error: {str(error)}")
+
+    def get_stage_stats(self):
+        stats = [self.transcribe_stats.snapshot(), self.write_stage.stats.snapshot(),
+                 self.notes_stage.stats.snapshot()]
+        if self.prefetcher:
+            stats.insert(0, self.prefetcher.stats.snapshot())
+        if self.notes_manager:
+            # Per-phase LLM timings inside the notes stage (title, single-pass, map, reduce)
+            stats.extend(self.notes_manager.get_phase_stats())
+        return stats
+
+    def format_stage_stats(self):
+        parts = []
+        for stats in self.get_stage_stats():
+            rate = stats['items_per_minute']
+            rate = f"{rate}/min" if rate is not None else "n/a"
+            parts.append(f"{stats['stage']}: {stats['items']} done, {stats['errors']} failed, "
+                         f"{stats['busy_seconds']}s busy, {rate}")
+        return "Stage throughput - " + " | ".join(parts)
+
+    def get_output_path(self, input_file, format_ext=None):
+        format_ext = format_ext or self.selected_formats(input_file)[0]
         base_filename = os.path.splitext(os.path.basename(input_file))[0] + f'.{format_ext}'
-        output_dir = self.ui.output_dir_var.get().strip()
+        if input_file in self.file_outputs:
+            output_dir = self.file_outputs[input_file][1]
+        else:
+            output_dir = self.ui.output_dir_var.get().strip()
         if (output_dir and os.path.isdir(output_dir)):
             return os.path.join(output_dir, base_filename)
         return os.path.join(os.path.dirname(input_file), base_filename)
-
-    def generate_srt(self, result, output_path):
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for i, segment in enumerate(result.get('segments', []), start=1):
-                start = format_timestamp(segment['start'])
-                end = format_timestamp(segment['end'])
-                f.write(f"{i}\n{start} --> {end}\n{segment['text'].strip()}\n\n")
-
-    def generate_vtt(self, result, output_path):
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write("WEBVTT\n\n")
-            for i, segment in enumerate(result.get('segments', []), start=1):
-                start = format_timestamp(segment['start']).replace(',', '.')
-                end = format_timestamp(segment['end']).replace(',', '.')
-                f.write(f"{start} --> {end}\n")
-                f.write(f"{segment['text'].strip()}\n\n")
-
-    def generate_txt(self, result, output_path):
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(result["text"])
-
-    def generate_json(self, result, output_path):
-        output_data = {
-            'text': result['text'],
-            'segments': result.get('segments', []),
-            'language': result.get('language', 'unknown')
-        }
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
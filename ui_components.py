@@ -1,16 +1,29 @@
 import customtkinter as ctk
 from tkinter import filedialog
 from tkinterdnd2 import DND_FILES, TkinterDnD
+import os
 import threading
 
 # Import TranscriptionManager after other core imports
 from transcription_manager import TranscriptionManager
+from progress import format_segment_line
+from transcript_writer import FORMATS
+from config import TRANSCRIBE_WORKERS
+
+
+class FormatSelection:
+    """format_var for TranscriptionManager: get() returns the checked formats"""
+    def __init__(self, variables):
+        self.variables = variables
+
+    def get(self):
+        return [fmt for fmt, variable in self.variables.items() if variable.get()]
 
 class TranscriberUI:
     def __init__(self):
         self.setup_window()
         # Initialize TranscriptionManager first
-        self.transcription_manager = TranscriptionManager(self)
+        self.transcription_manager = TranscriptionManager(self, workers=TRANSCRIBE_WORKERS, preload=False)
         self.create_ui_components()
 
     def setup_window(self):
@@ -69,15 +82,16 @@ class TranscriberUI:
         format_frame.pack(fill="x", pady=5)
         
         ctk.CTkLabel(format_frame, text="Output Format:").pack(side="left", padx=10)
-        self.format_var = ctk.StringVar(value="srt")
-        formats = ["srt", "txt", "vtt", "json"]
-        for fmt in formats:
-            ctk.CTkRadioButton(
+        # Every checked format is written from the same transcription
+        self.format_vars = {fmt: ctk.BooleanVar(value=fmt == "srt") for fmt in FORMATS}
+        self.format_var = FormatSelection(self.format_vars)
+        for fmt, variable in self.format_vars.items():
+            ctk.CTkCheckBox(
                 format_frame,
                 text=fmt.upper(),
-                variable=self.format_var,
-                value=fmt
-            ).pack(side="left", padx=10)
+                variable=variable,
+                width=70
+            ).pack(side="left", padx=5)
 
         # Output directory frame
         output_frame = ctk.CTkFrame(top_frame)
@@ -120,6 +134,16 @@ class TranscriberUI:
         )
         self.notes_state.pack(side="left", padx=10)
 
+        # Progress of the file currently transcribing
+        progress_frame = ctk.CTkFrame(top_frame)
+        progress_frame.pack(fill="x", pady=5)
+
+        self.progress_bar = ctk.CTkProgressBar(progress_frame, width=400)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(side="left", padx=10)
+        self.progress_label = ctk.CTkLabel(progress_frame, text="")
+        self.progress_label.pack(side="left", padx=10)
+
     def create_drop_zone(self):
         self.status_label = ctk.CTkLabel(
             self.main_frame,
@@ -163,6 +187,24 @@ class TranscriberUI:
         # Schedule update in main thread
         self.window.after(0, _update)
 
+    def update_segments(self, file_path, segments):
+        """Show a batch of newly transcribed segments in the output area"""
+        self.update_output("\n".join(format_segment_line(segment) for segment in segments))
+
+    def update_progress(self, file_path, percent, eta):
+        def _update():
+            if percent is None:
+                self.progress_label.configure(text=os.path.basename(file_path))
+                return
+            self.progress_bar.set(percent / 100)
+            text = f"{os.path.basename(file_path)}: {percent:.0f}%"
+            if eta is not None:
+                minutes, seconds = divmod(int(eta), 60)
+                text += f" ({minutes}:{seconds:02d} left)"
+            self.progress_label.configure(text=text)
+
+        self.window.after(0, _update)
+
     def browse_output_dir(self):
         directory = filedialog.askdirectory(title="Select Output Directory")
         if directory:
@@ -191,4 +233,8 @@ class TranscriberUI:
         self.notes_state.configure(text=states.get(state, states["ready"]))
 
     def run(self):
+        # Start loading the model (and torch) only once the window is up
+        self.window.after(100, self.transcription_manager.preload)
+        # Then pick up whatever the last session left unfinished
+        self.window.after(200, self.transcription_manager.resume_jobs)
         self.window.mainloop()
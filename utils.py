@@ -1,10 +1,45 @@
-from datetime import timedelta
-
-def format_timestamp(seconds):
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-    milliseconds = int((td.total_seconds() - total_seconds) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{milliseconds:03}"
+import glob
+import os
+
+MEDIA_EXTENSIONS = {
+    '.mp4', '.mkv', '.mov', '.avi', '.webm', '.flv', '.wmv', '.m4v',
+    '.mp3', '.wav', '.m4a', '.flac', '.ogg', '.opus', '.aac', '.wma',
+}
+
+def format_timestamp(seconds, decimal_marker=','):
+    """HH:MM:SS,mmm (SRT; pass '.' for VTT), rounded to the nearest millisecond"""
+    # Plain integer arithmetic and %-formatting: this runs twice per subtitle line
+    milliseconds = round(seconds * 1000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    minutes, secs = divmod(secs, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d%s%03d" % (hours, minutes, secs, decimal_marker, milliseconds)
+
+def is_media_file(path):
+    return os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS
+
+def collect_media_files(inputs, recursive=False):
+    """Expand files, directories and glob patterns into a de-duplicated list of media files"""
+    files = []
+    seen = set()
+
+    def add(path):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            files.append(path)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            for path in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(path) and is_media_file(path):
+                    add(path)
+        elif os.path.isfile(item):
+            # Explicitly named files are taken as-is, whatever their extension
+            add(item)
+        else:
+            for path in sorted(glob.glob(item, recursive=recursive)):
+                if os.path.isfile(path) and is_media_file(path):
+                    add(path)
+    return files
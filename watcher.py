@@ -0,0 +1,227 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from transcript_cache import file_digest
+from utils import is_media_file
+
+__all__ = ['Inotify', 'FolderWatcher']
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event: wd, mask, cookie, len, then len bytes of NUL-padded name
+EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """Just enough of inotify(7), through ctypes so no extra package is needed (Linux only)"""
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        """(path, is_dir) for the events arriving within timeout seconds;
+        (None, False) if the kernel queue overflowed and events were lost"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, False))
+            elif name and wd in self.watches:
+                events.append((os.path.join(self.watches[wd], os.fsdecode(name)), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Hands each media file that lands in `directories` to on_ready(path),
+    from a background thread, once it has stopped changing.
+
+    Changes are picked up through inotify on Linux and by rescanning every
+    poll_interval seconds elsewhere (or with polling=True). A new or changed
+    file (by size and mtime) has to keep the same size and mtime for
+    settle_seconds, so files still being recorded or copied are left alone.
+    It is then hashed and skipped if the same content was already handed
+    over, so a touched or re-copied file isn't transcribed again."""
+    def __init__(self, directories, on_ready, recursive=False, settle_seconds=5.0, poll_interval=2.0,
+                 skip_existing=False, polling=False):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.on_ready = on_ready
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.poll_interval = max(0.1, poll_interval)
+        self.skip_existing = skip_existing
+        self.polling = polling or not sys.platform.startswith('linux')
+        self.inotify = None
+        # path -> (size, mtime_ns) as last settled
+        self.known = {}
+        # path -> (size, mtime_ns, when that was first seen)
+        self.pending = {}
+        self.digests = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def mode(self):
+        return "inotify" if self.inotify else "polling"
+
+    def start(self):
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                raise NotADirectoryError(directory)
+        if not self.polling:
+            try:
+                self.inotify = Inotify()
+                for directory in self.walk_directories(self.directories):
+                    self.inotify.add(directory)
+            except (OSError, AttributeError) as e:
+                # e.g. no inotify in this libc, or max_user_watches reached
+                print(f"Warning: inotify unavailable ({e}), polling instead", file=sys.stderr)
+                if self.inotify:
+                    self.inotify.close()
+                self.inotify = None
+        for path in self.files(self.directories):
+            if self.skip_existing:
+                identity = self.identity(path)
+                if identity:
+                    self.known[path] = identity
+            else:
+                self.mark(path)
+        self.thread = threading.Thread(target=self.run, name="folder-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.poll_interval + 5)
+            self.thread = None
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.inotify:
+                for path, is_dir in self.inotify.read(self.poll_interval):
+                    if path is None:
+                        self.rescan()
+                    elif is_dir:
+                        if self.recursive:
+                            self.watch_new_directory(path)
+                    else:
+                        self.mark(path)
+            else:
+                self.stop_event.wait(self.poll_interval)
+                self.rescan()
+            self.settle()
+
+    def walk_directories(self, roots):
+        for root in roots:
+            yield root
+            if self.recursive:
+                for parent, subdirs, _ in os.walk(root):
+                    subdirs[:] = [d for d in subdirs if not d.startswith('.')]
+                    for subdir in subdirs:
+                        yield os.path.join(parent, subdir)
+
+    def files(self, roots):
+        for directory in self.walk_directories(roots):
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    yield path
+
+    def watch_new_directory(self, directory):
+        try:
+            for subdir in self.walk_directories([directory]):
+                self.inotify.add(subdir)
+        except OSError:
+            pass
+        # Files may have landed before the watch was in place
+        for path in self.files([directory]):
+            self.mark(path)
+
+    def rescan(self):
+        for path in self.files(self.directories):
+            self.mark(path)
+
+    @staticmethod
+    def identity(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def mark(self, path):
+        """Note that path may have changed; it becomes pending until it settles"""
+        if not is_media_file(path) or os.path.basename(path).startswith('.'):
+            return
+        identity = self.identity(path)
+        if identity is None:
+            self.pending.pop(path, None)
+            return
+        if self.known.get(path) == identity:
+            return
+        entry = self.pending.get(path)
+        if entry is None or entry[:2] != identity:
+            self.pending[path] = identity + (time.monotonic(),)
+
+    def settle(self):
+        """Hand over pending files that haven't changed for settle_seconds"""
+        now = time.monotonic()
+        for path in list(self.pending):
+            self.mark(path)
+            entry = self.pending.get(path)
+            if entry is None or now - entry[2] < self.settle_seconds:
+                continue
+            del self.pending[path]
+            self.known[path] = entry[:2]
+            if entry[0] == 0:
+                # Nothing written yet; it becomes pending again once it grows
+                continue
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+            if digest in self.digests:
+                continue
+            self.digests.add(digest)
+            self.on_ready(path)